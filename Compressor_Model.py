@@ -1,6 +1,15 @@
 import pandas as pd
 import numpy as np
-from params import  P1, P2, gamma, cp, eta_comp, eta_trans, eta_TES
+from params import  P1, P2, gamma, cp, eta_comp, eta_trans, eta_TES, real_gas, property_table_file
+from params import compressor_map, compressor_capacity
+from real_gas_properties import get_property_table
+from efficiency_maps import get_efficiency_map
+
+# Columns written by compressor_energy_model / compressor_stage
+OUTPUT_COLUMNS = (
+    'E_elec_kWh', 'E_elec_kJ', 'm_air_kg', 'E_CAES_kJ', 'E_TES_kWh',
+    'Compressor_Power_kW', 'T2s_K', 'T2_K', 'Delta_h_kJ_per_kg', 'Compressor_Efficiency'
+)
 
 def compressor_energy_model(
     df,
@@ -25,6 +34,14 @@ def compressor_energy_model(
       7. Thermal energy stored (TES):
             E_TES_kWh = eta_TES * E_elec_kWh
 
+    With real_gas = True in params.py, steps 1-3 use the shared real-gas
+    property table instead (isentropic outlet from s(P1, T1) = s(P2, T2s),
+    Δh = (h(P2, T2s) - h(P1, T1)) / eta_comp and T2 from h(P2, T2) = h1 + Δh).
+
+    With a compressor_map in params.py, eta_comp is replaced by the map's
+    efficiency at the load fraction E_elec_kWh / compressor_capacity and the
+    pressure ratio P2 / P1, hour by hour.
+
     Assumptions:
       - df['Power_Output'] holds the wind turbine's electrical power in kW.
       - A 1-hour timestep is used (so kW equals kWh per hour).
@@ -42,41 +59,93 @@ def compressor_energy_model(
         'E_CAES_kWh': Energy stored in compressed air [kWh]
         'E_TES_kWh': Thermal energy stored [kWh]
         'Compressor_Power_kW': Compressor power used (average over 1-hour)
+        'Compressor_Efficiency': Isentropic efficiency used [decimal]
     """
 
-    # 1. Ideal isentropic outlet temperature:
-    T2s = (df['temp']+273.15) * (P2 / P1) ** ((gamma - 1) / gamma)
+    values = compressor_arrays(df['temp'].to_numpy(dtype=float), df['Total_Power_Output'].to_numpy(dtype=float))
+    for col in OUTPUT_COLUMNS:
+        df[col] = values[col]
 
-    # 2. Actual outlet temperature considering compressor efficiency:
-    T2 = (df['temp']+273.15)  + (T2s - (df['temp']+273.15) ) / eta_comp
+    return df
 
-    # 3. Enthalpy change per kg of air [kJ/kg]:
-    delta_h = cp * (T2 - (df['temp']+273.15) )
 
-    # Overall efficiency (compressor and transmission):
-    eta_total = eta_comp * eta_trans
+def compressor_arrays(temp_C, total_power_kW):
+    """
+    Array form of the compressor model (steps 1-7 of compressor_energy_model).
+
+    Parameters:
+        temp_C (array): ambient (inlet) temperature [°C]
+        total_power_kW (array): wind farm electrical output [kW]
 
+    Returns:
+        dict of arrays keyed by OUTPUT_COLUMNS.
+    """
     # 4. Electrical energy available (Power_Output in kW for 1 hour equals kWh)
     #    Convert to kJ: 1 kWh = 3600 kJ.
-    df['E_elec_kWh'] = df['Total_Power_Output'].clip(lower=0)
-    df['E_elec_kJ'] = df['E_elec_kWh'] * 3600.0
+    E_elec_kWh = np.maximum(total_power_kW, 0)
+    E_elec_kJ = E_elec_kWh * 3600.0
 
-    # 5. Compute mass of air compressed [kg]:
-    df['m_air_kg'] = (df['E_elec_kJ'] * eta_total) / delta_h
+    # Compressor efficiency: constant, or from the part-load map in every hour
+    # with compression. Hours without wind keep eta_comp: their T2 is the
+    # expander inlet temperature of discharge (mode 4), which must not
+    # depend on a compressor load of zero.
+    eta_map = get_efficiency_map(compressor_map)
+    if eta_map is None:
+        eta_c = eta_comp
+    else:
+        eta_c = np.where(E_elec_kWh > 0, eta_map(E_elec_kWh / compressor_capacity, P2 / P1), eta_comp)
 
-    # 6. Energy stored in compressed air (CAES) in kJ and kWh:
-    df['E_CAES_kJ'] = df['m_air_kg'] * delta_h
-    # df['E_CAES_kWh'] = df['E_CAES_kJ'] / 3600.0
+    if real_gas:
+        # 1-3. Real-gas compression from the precomputed property table
+        table = get_property_table(property_table_file)
+        T1 = temp_C + 273.15
+        h1 = table.h(P1, T1)
+        s1 = table.s(P1, T1)
+        T2s = table.T_from_s(P2, s1)
+        delta_h = (table.h_from_s(P2, s1) - h1) / eta_c
+        T2 = table.T_from_h(P2, h1 + delta_h)
+    else:
+        # 1. Ideal isentropic outlet temperature:
+        T2s = (temp_C+273.15) * (P2 / P1) ** ((gamma - 1) / gamma)
 
-    # 7. Thermal Energy Storage (TES): a fraction of the electrical energy (if captured)
-    df['E_TES_kWh'] = eta_total * eta_TES * df['E_elec_kWh']
+        # 2. Actual outlet temperature considering compressor efficiency:
+        T2 = (temp_C+273.15)  + (T2s - (temp_C+273.15) ) / eta_c
 
-    # Compressor power is simply the electrical power used over the hour.
-    df['Compressor_Power_kW'] = df['E_elec_kWh']  # (since 1 kWh over 1h equals 1 kW)
+        # 3. Enthalpy change per kg of air [kJ/kg]:
+        delta_h = cp * (T2 - (temp_C+273.15) )
 
-    # Optional: Store intermediate temperatures and enthalpy change for reference.
-    df['T2s_K'] = T2s
-    df['T2_K'] = T2
-    df['Delta_h_kJ_per_kg'] = delta_h
+    # Overall efficiency (compressor and transmission):
+    eta_total = eta_c * eta_trans
 
-    return df
+    # 5. Compute mass of air compressed [kg]:
+    m_air_kg = (E_elec_kJ * eta_total) / delta_h
+
+    return {
+        'E_elec_kWh': E_elec_kWh,
+        'E_elec_kJ': E_elec_kJ,
+        'm_air_kg': m_air_kg,
+        # 6. Energy stored in compressed air (CAES) in kJ:
+        'E_CAES_kJ': m_air_kg * delta_h,
+        # 7. Thermal Energy Storage (TES): a fraction of the electrical energy (if captured)
+        'E_TES_kWh': eta_total * eta_TES * E_elec_kWh,
+        # Compressor power is simply the electrical power used over the hour.
+        'Compressor_Power_kW': E_elec_kWh,
+        # Intermediate temperatures and enthalpy change for reference.
+        'T2s_K': T2s,
+        'T2_K': T2,
+        'Delta_h_kJ_per_kg': delta_h,
+        'Compressor_Efficiency': np.broadcast_to(eta_c, E_elec_kWh.shape),
+    }
+
+
+def compressor_stage(buf):
+    """
+    Array version of compressor_energy_model.
+
+    Reads 'temp' and 'Total_Power_Output' from a StageBuffer (or any mapping
+    of arrays) and writes the OUTPUT_COLUMNS views in place.
+    """
+    values = compressor_arrays(buf['temp'], buf['Total_Power_Output'])
+    for col in OUTPUT_COLUMNS:
+        buf[col][...] = values[col]
+    return buf
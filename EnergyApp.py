@@ -2,16 +2,18 @@ import os
 import re
 import io
 import sys
+import ast
+import time
+import tempfile
+import multiprocessing
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, PhotoImage
 import pandas as pd
 from datetime import datetime
 
 # Import user modules
-import wind_turbine_model
-import Compressor_Model
-import energy_management
-import revenue
+import pipeline
+import plotting
 
 # Paths
 DIR_PATH = os.path.dirname(__file__)
@@ -29,6 +31,13 @@ class EnergyApp(tk.Tk):
         self.data = None
         self.params = {}
         self.entries = {}
+        # Parameter values applied live on top of params.py, and the resident
+        # what-if session (preprocessed input kept in memory)
+        self.overrides = {}
+        self.session = None
+        self.interactive = tk.BooleanVar(value=False)
+        # Figures are rendered in a background process (see plotting.py)
+        self.renderer = plotting.Renderer()
 
         # Menu bar
         menubar = tk.Menu(self)
@@ -49,7 +58,9 @@ class EnergyApp(tk.Tk):
         control_frame = tk.Frame(self)
         control_frame.pack(fill=tk.X, padx=10, pady=5)
         tk.Button(control_frame, text="Run Analysis", command=self.run_analysis, bg="#4CAF50", fg="white").pack(side=tk.LEFT)
+        tk.Checkbutton(control_frame, text="Interactive what-if", variable=self.interactive).pack(side=tk.LEFT, padx=10)
         tk.Button(control_frame, text="Save Results", command=self.save_results).pack(side=tk.RIGHT)
+        tk.Button(control_frame, text="Plot Results", command=self.plot_results).pack(side=tk.RIGHT, padx=5)
 
         # Output log
         log_frame = tk.Frame(self)
@@ -59,7 +70,7 @@ class EnergyApp(tk.Tk):
         self.log.pack(fill=tk.BOTH, expand=True)
 
     def browse_file(self):
-        filetypes = [("Excel files", "*.xlsx;*.xls"), ("All files", "*.*")]
+        filetypes = [("Excel files", "*.xlsx;*.xls"), ("CSV files", "*.csv"), ("All files", "*.*")]
         path = filedialog.askopenfilename(title="Select wind data file", filetypes=filetypes)
         if path:
             self.file_path = path
@@ -67,6 +78,7 @@ class EnergyApp(tk.Tk):
             self.log.delete(1.0, tk.END)
             self.log.insert(tk.END, f"Selected file: {path}\n")
             self.data = None
+            self.session = None
 
     def run_analysis(self):
         if not self.file_path:
@@ -80,29 +92,23 @@ class EnergyApp(tk.Tk):
         old_stdout = sys.stdout
         sys.stdout = buf
         try:
-            # 1. Read wind data
-            df = wind_turbine_model.read_wind_data(self.file_path)
-            self.log.insert(tk.END, f"Data loaded: {len(df)} rows\n")
-            
-            # 2. Wind power calculations
-            df = wind_turbine_model.calculate_power_output(df)
-            self.log.insert(tk.END, "Calculated wind power output.\n")
-
-            # 3. Apply operational conditions
-            df = wind_turbine_model.apply_conditions(df)
-            self.log.insert(tk.END, "Applied turbine operating conditions.\n")
-
-            # 4. Compressor model
-            df = Compressor_Model.compressor_energy_model(df)
-            self.log.insert(tk.END, "Computed compressor energy model.\n")
-
-            # 5. Energy management (storage allocation)
-            df = energy_management.allocate_energy_storage(df)
-            self.log.insert(tk.END, "Allocated energy storage.\n")
-
-            # 6. Revenue calculation
-            df = revenue.calculate_revenue(df)
-            self.log.insert(tk.END, "Calculated revenue.\n")
+            if self.interactive.get():
+                # Load once and keep the preprocessed arrays in memory; parameter
+                # changes then only re-run the stages downstream of them
+                start = time.perf_counter()
+                self.session = pipeline.Session(self.file_path, self.overrides)
+                sys.stdout = old_stdout
+                self.data = None
+                self.log.insert(tk.END, "Interactive session ready: edit parameters and press Apply.\n")
+                self._log_summary(time.perf_counter() - start)
+                return
+
+            # Read → wind power → conditions → compressor → storage allocation → revenue
+            df = pipeline.run_pipeline(
+                self.file_path,
+                overrides=self.overrides,
+                log=lambda msg: self.log.insert(tk.END, msg + "\n")
+            )
 
             # Restore stdout and write captured prints to log
             sys.stdout = old_stdout
@@ -110,12 +116,26 @@ class EnergyApp(tk.Tk):
             self.log.insert(tk.END, output)
             # Save processed DataFrame
             self.data = df
+            self.session = None
         except Exception as e:
             sys.stdout = old_stdout
             messagebox.showerror("Analysis Error", str(e))
             self.log.insert(tk.END, f"Error during analysis: {e}\n")
 
+    def _log_summary(self, seconds):
+        summary = self.session.summary()
+        stages = ", ".join(f"{stage} {t:.2f}s" for stage, t in self.session.timings.items())
+        self.log.insert(tk.END, f"Updated in {seconds:.2f}s ({stages or 'no stage affected'})\n")
+        self.log.insert(tk.END, f"  Total revenue without storage: €{summary['revenue_without_storage']:>15,.2f}\n")
+        self.log.insert(tk.END, f"  Grand total revenue:           €{summary['total_revenue']:>15,.2f}\n")
+        self.log.insert(tk.END, f"  Annual saving from storage:    €{summary['saving_from_storage']:>15,.2f}\n")
+        modes = ", ".join(f"{mode}: {pct:.1f}%" for mode, pct in summary['operating_mode_pct'].items())
+        self.log.insert(tk.END, f"  Operating modes: {modes}\n")
+        self.log.see(tk.END)
+
     def save_results(self):
+        if self.data is None and self.session is not None:
+            self.data = self.session.frame()
         if self.data is None:
             messagebox.showwarning("No Data", "No analysis results to save. Run analysis first.")
             return
@@ -141,6 +161,36 @@ class EnergyApp(tk.Tk):
                 messagebox.showerror("Save Error", str(e))
                 self.log.insert(tk.END, f"Error saving results: {e}\n")
 
+    def plot_results(self):
+        if self.data is None and self.session is not None:
+            self.data = self.session.frame()
+        if self.data is None:
+            messagebox.showwarning("No Data", "No analysis results to plot. Run analysis first.")
+            return
+        # Decimated to the figure width and drawn off the Tk thread; the image
+        # is shown once the renderer is done
+        path = os.path.join(tempfile.gettempdir(), f"energyapp_plot_{os.getpid()}.png")
+        future = self.renderer.submit('series', path, title=os.path.basename(self.file_path or ''),
+                                      **plotting.series_data(self.data))
+        self.log.insert(tk.END, "Rendering plot...\n")
+        plotting.when_done(self, future, self._show_plot)
+
+    def _show_plot(self, future):
+        try:
+            path = future.result()
+        except Exception as e:
+            messagebox.showerror("Plot Error", str(e))
+            self.log.insert(tk.END, f"Error while plotting: {e}\n")
+            return
+        win = tk.Toplevel(self)
+        win.title("Results")
+        image = PhotoImage(file=path)
+        label = tk.Label(win, image=image)
+        label.image = image
+        label.pack()
+        self.log.insert(tk.END, f"Plot rendered to {path}\n")
+        self.log.see(tk.END)
+
     def edit_params(self):
         # Load and parse params
         lines = open(PARAMS_FILE, 'r').read().splitlines(keepends=True)
@@ -189,6 +239,8 @@ class EnergyApp(tk.Tk):
         }
         for name, (x, y) in positions.items():
             val = self.params.get(name, {}).get('value', '')
+            if name in self.overrides:
+                val = repr(self.overrides[name])
             unit = units.get(name, '')
             lbl_text = f"{name} ({unit}) =" if unit else f"{name} ="
             lbl = tk.Label(canvas, text=lbl_text, bg='#000', fg='#0f0', anchor='e')
@@ -198,9 +250,40 @@ class EnergyApp(tk.Tk):
             canvas.create_window(x + 5, y, window=ent, anchor='nw')
             self.entries[name] = ent
 
-        # Save button
+        # Save button (writes params.py) and Apply button (live, this session only)
         btn = tk.Button(win, text="Save Parameters", command=lambda: self._save_params(lines, win))
         canvas.create_window(250, 650, window=btn, anchor='center')
+        btn = tk.Button(win, text="Apply", command=self._apply_params)
+        canvas.create_window(250, 610, window=btn, anchor='center')
+
+    def _apply_params(self):
+        # Entry values as Python literals (numbers, True/False, None), else as text
+        values = {}
+        for name, ent in self.entries.items():
+            text = ent.get().strip()
+            try:
+                values[name] = ast.literal_eval(text)
+            except (ValueError, SyntaxError):
+                values[name] = text
+        try:
+            values = pipeline.expand_overrides(values)
+        except KeyError as e:
+            messagebox.showerror("Parameter Error", str(e))
+            return
+        self.overrides.update(values)
+        self.data = None
+        if self.session is None:
+            self.log.insert(tk.END, "Parameters applied; they are used by the next analysis run.\n")
+            return
+        start = time.perf_counter()
+        try:
+            with pipeline.model_output():
+                self.session.update(values)
+        except Exception as e:
+            messagebox.showerror("Analysis Error", str(e))
+            self.log.insert(tk.END, f"Error during update: {e}\n")
+            return
+        self._log_summary(time.perf_counter() - start)
 
     def _save_params(self, lines, window):
         updated = False
@@ -218,11 +301,14 @@ class EnergyApp(tk.Tk):
         if updated:
             with open(PARAMS_FILE, 'w') as f:
                 f.writelines(lines)
+            self._apply_params()
             messagebox.showinfo("Parameters Updated", "params.py has been updated.")
         else:
             messagebox.showinfo("No Changes", "No parameter values were changed.")
         window.destroy()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = EnergyApp()
     app.mainloop()
+    app.renderer.close()
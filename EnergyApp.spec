@@ -5,7 +5,7 @@ a = Analysis(
     ['EnergyApp.py'],
     pathex=[],
     binaries=[],
-    datas=[('params.py', '.'), ('wind_turbine_model.py', '.'), ('Compressor_Model.py', '.'), ('energy_management.py', '.'), ('revenue.py', '.')],
+    datas=[('params.py', '.'), ('wind_turbine_model.py', '.'), ('Compressor_Model.py', '.'), ('energy_management.py', '.'), ('revenue.py', '.'), ('real_gas_properties.py', '.'), ('pipeline.py', '.'), ('acaes.py', '.'), ('simulation_service.py', '.'), ('data_plane.py', '.'), ('cycle_counting.py', '.'), ('settlement.py', '.'), ('archive_pipeline.py', '.'), ('forecast_backtest.py', '.'), ('result_store.py', '.'), ('plotting.py', '.'), ('efficiency_maps.py', '.'), ('segment_scan.py', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+acaes.py
+
+Headless command line interface for the Wind-CAES pipeline.
+
+Usage:
+    python acaes.py run   INPUT [INPUT ...] [--config CONFIG] [--output-dir DIR] [--jobs N]
+    python acaes.py sweep INPUT [INPUT ...]  --config CONFIG  [--output-dir DIR] [--jobs N]
+    python acaes.py bench INPUT [INPUT ...] [--config CONFIG] [--repeat N]
+
+The config file is JSON:
+    {
+        "params": {"turbine_capacity": 20000, "price_threshold": 0.06},
+        "sweep":  {"TES_cap": [100000, 200000], "price_threshold": [0.05, 0.07]},
+        "settlement": {"start": "2023-01-01T00", "tariff_peak": 0.04, "tariff_offpeak": 0.01,
+                       "schedule": "input"}
+    }
+"params" overrides values from params.py for every run ("price_threshold" sets
+both the charge and the discharge threshold). "sweep" is only used by the
+sweep command, which runs the full product of the listed values.
+"settlement" is used by sweep --settle PERIOD: the timestamp of the first
+hour and the time-of-use network tariff on grid imports (€/kWh, peak hours
+"peak_hours", default [7, 22] on weekdays). The time-of-use tariff is charged
+on top of grid_import_tariff (per scenario), which is the tariff the dispatch
+decides grid charging on and that Grid_import_cost includes. Intraday, imbalance and import
+prices are read from the optional input columns price_intraday,
+price_imbalance and price_import. "schedule" selects the day-ahead schedule
+that the export is settled against: "input" (default) reads it from the
+optional input columns schedule_kWh and intraday_kWh, "persistence" schedules
+every hour at the export of the same hour on the previous day, and "actual"
+schedules the actual export. The deviation of the export from the schedule
+(less intraday sales) is settled at the imbalance price, so without a
+schedule column "input" settles no imbalance.
+
+sweep --store DB keeps every result in a local SQLite result store, keyed by
+the input file hash, the effective parameters and the model code version:
+points already in the store are reused instead of recomputed (their tables
+too, with --keep-results), and every sweep writes a manifest.json with the
+inputs, code version, reused/computed counts and timings.
+
+Each command prints one JSON document to stdout (per-stage model output goes
+to stderr with --verbose) and exits with status 1 if any run failed.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import statistics
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import pipeline
+import energy_management
+from data_plane import StageBuffer
+from cycle_counting import DispatchAnalytics
+import settlement
+import result_store
+
+
+def load_config(path):
+    if not path:
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def sweep_points(config):
+    """Expands the "sweep" grid of a config into a list of override dicts."""
+    grid = config.get('sweep', {})
+    names = list(grid)
+    base = config.get('params', {})
+    return [dict(base, **dict(zip(names, values)))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def write_frame(frame, path):
+    """Writes a result table as Parquet or CSV, by the extension of path."""
+    if path.endswith('.parquet'):
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+
+def run_task(task):
+    """Runs one input file with one set of overrides; returns a JSON-serializable record."""
+    record = {'input': task['input'], 'params': task['overrides'], 'status': 'ok'}
+    start = time.perf_counter()
+    try:
+        with pipeline.model_output(task['verbose']):
+            df = pipeline.preprocessed_frame(task['input'], task['overrides'])
+            df = pipeline.dispatch(df.copy(), task['overrides'])
+        record['summary'] = pipeline.summarize(df)
+        if task['output']:
+            write_frame(df, task['output'])
+            record['output'] = task['output']
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+        if task['verbose']:
+            traceback.print_exc(file=sys.stderr)
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def run_tasks(tasks, jobs, task_fn=run_task):
+    if jobs == 1 or len(tasks) <= 1:
+        return [task_fn(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(task_fn, tasks))
+
+
+def run_sweep_chunk(task):
+    """
+    Runs a chunk of sweep points as one batched dispatch on the shared input
+    buffer of the task (attached by spec, or passed directly when inline).
+    Records report the points as given in the config ('params'), like the
+    records of points reused from the result store.
+    """
+    inputs = task['buffer'] if isinstance(task['buffer'], StageBuffer) else StageBuffer.attach(task['buffer'])
+    records = []
+    start = time.perf_counter()
+    try:
+        analytics = DispatchAnalytics() if task['cycles'] else None
+        if not task['outputs'] and not task['settle']:
+            # Summary-only dispatch: no trajectories are kept
+            with pipeline.model_output(task['verbose']):
+                summaries, _ = pipeline.run_summaries(inputs, task['points'], task['overrides'], analytics=analytics)
+        else:
+            with pipeline.model_output(task['verbose']):
+                out, _ = pipeline.run_scenarios(inputs, task['points'], task['overrides'], analytics=analytics)
+            summaries = pipeline.summarize_buffer(inputs, out, analytics)
+        if task['settle']:
+            config = task['settlement']
+            start_hour = config.get('start', '2023-01-01T00')
+            tariff = settlement.tou_tariff(len(inputs['price']), start_hour, config.get('tariff_peak', 0.0),
+                                           config.get('tariff_offpeak', 0.0), tuple(config.get('peak_hours', (7, 22))))
+            # Network tariff of the dispatch (per scenario) plus the time-of-use tariff
+            with pipeline.parameters(task['overrides']):
+                settings = energy_management.dispatch_settings(pipeline.batch_settings(task['points']))
+            tariff = np.reshape(settings['grid_import_tariff'], (-1, 1)) + tariff
+            schedule, intraday = settlement.day_ahead_schedule(inputs, out, config.get('schedule', 'input'))
+            result = settlement.settle(inputs, out, start_hour, task['settle'], tariff=tariff,
+                                       schedule=schedule, intraday=intraday, by_mode=True)
+            for summary, record in zip(summaries, settlement.settlement_records(result)):
+                summary['settlement'] = record
+        seconds = (time.perf_counter() - start) / len(task['points'])
+        for k, (point, summary) in enumerate(zip(task['params'], summaries)):
+            record = {'input': task['input'], 'params': point,
+                      'status': 'ok', 'summary': summary, 'seconds': seconds}
+            if task['outputs']:
+                frame = pipeline.result_frame(inputs, out, k)
+                write_frame(frame, task['outputs'][k])
+                record['output'] = task['outputs'][k]
+                if task.get('blobs'):
+                    result_store.save_blob(task['blobs'][k], frame)
+                    record['blob'] = task['blobs'][k]
+            records.append(record)
+    except Exception as e:
+        if task['verbose']:
+            traceback.print_exc(file=sys.stderr)
+        records = [{'input': task['input'], 'params': point, 'status': 'error',
+                    'error': f"{type(e).__name__}: {e}", 'seconds': time.perf_counter() - start}
+                   for point in task['params']]
+    finally:
+        if inputs is not task['buffer']:
+            inputs.close()
+    return records
+
+
+def _output_path(output_dir, input_path, suffix, fmt):
+    if output_dir is None or fmt == 'none':
+        return None
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{stem}{suffix}.{fmt}")
+
+
+def cmd_run(args, config):
+    overrides = config.get('params', {})
+    tasks = [{'input': path, 'overrides': overrides, 'verbose': args.verbose,
+              'output': _output_path(args.output_dir, path, '_results', args.format)}
+             for path in args.inputs]
+    return run_tasks(tasks, args.jobs)
+
+
+def cmd_sweep(args, config):
+    """
+    Sweep points that differ only in per-scenario dispatch parameters are run
+    as batched dispatch passes over one preprocessed input buffer. With more
+    than one job the buffer lives in shared memory and every worker attaches
+    to it and runs its own chunk of points.
+    """
+    points = sweep_points(config)
+    keep_results = bool(args.keep_results and args.output_dir and args.format != 'none')
+    results = [None] * (len(args.inputs) * len(points))
+    backing = 'heap' if args.jobs == 1 else 'shm'
+    store = result_store.ResultStore(args.store) if args.store else None
+    # Full result buffers give summarize_buffer summaries, summary-only runs
+    # summary_records ones (with throughput and storage); keep them apart
+    options = {'cycles': args.cycles, 'settle': args.settle,
+               'settlement': config.get('settlement', {}) if args.settle else None,
+               'summary': 'buffer' if keep_results or args.settle else 'totals'}
+    manifest = {'command': 'sweep', 'argv': sys.argv[1:], 'config': config, 'started': time.time(),
+                'code_version': result_store.code_version(), 'inputs': {}}
+    for n, path in enumerate(args.inputs):
+        start = time.perf_counter()
+        todo = list(range(len(points)))
+        keys = input_id = None
+        if store is not None:
+            # Points already in the store are reused; only the rest is computed
+            try:
+                input_id = result_store.input_hash(path)
+            except OSError as e:
+                input_id = None
+                for i in todo:
+                    results[n * len(points) + i] = {'input': path, 'params': points[i], 'status': 'error',
+                                                    'error': f"{type(e).__name__}: {e}"}
+                todo = []
+            if input_id is not None:
+                keys = [result_store.result_key(input_id, point, options) for point in points]
+                found = store.lookup(keys)
+                todo = []
+                for i, key in enumerate(keys):
+                    stored = found.get(key)
+                    output = _output_path(args.output_dir, path, f'_point{i:04d}', args.format) if keep_results else None
+                    if stored is None or (output and not stored['blob']):
+                        todo.append(i)
+                        continue
+                    record = {'input': path, 'params': points[i], 'status': 'ok', 'summary': stored['summary'],
+                              'seconds': 0.0, 'cached': True, 'key': key}
+                    if output:
+                        write_frame(result_store.load_blob(stored['blob']), output)
+                        record['output'] = output
+                    results[n * len(points) + i] = record
+        lookup_seconds = time.perf_counter() - start
+
+        for fixed, group, batch in pipeline.group_points([points[i] for i in todo]):
+            indices = [todo[j] for j in group]
+            try:
+                with pipeline.model_output(args.verbose):
+                    inputs = pipeline.load_buffer(path, fixed, backing=backing)
+            except Exception as e:
+                for i in indices:
+                    results[n * len(points) + i] = {'input': path, 'params': points[i], 'status': 'error',
+                                                    'error': f"{type(e).__name__}: {e}"}
+                continue
+            with inputs:
+                chunk = -(-len(indices) // args.jobs)
+                tasks = []
+                for a in range(0, len(indices), chunk):
+                    tasks.append({
+                        'input': path, 'overrides': fixed, 'points': batch[a:a + chunk],
+                        'params': [points[i] for i in indices[a:a + chunk]],
+                        'buffer': inputs if backing == 'heap' else inputs.spec(),
+                        'verbose': args.verbose, 'cycles': args.cycles,
+                        'settle': args.settle, 'settlement': config.get('settlement', {}),
+                        'outputs': [_output_path(args.output_dir, path, f'_point{i:04d}', args.format)
+                                    for i in indices[a:a + chunk]] if keep_results else None,
+                        'blobs': [store.blob_path(keys[i]) for i in indices[a:a + chunk]]
+                                 if store is not None and keep_results else None,
+                    })
+                chunk_records = run_tasks(tasks, args.jobs, run_sweep_chunk)
+            for i, record in zip(indices, itertools.chain.from_iterable(chunk_records)):
+                results[n * len(points) + i] = record
+                if store is not None and record['status'] == 'ok':
+                    record['key'] = keys[i]
+                    store.put(keys[i], input_id, points[i], record['summary'], record['seconds'],
+                              record.get('blob'), commit=False)
+        if store is not None:
+            store.db.commit()
+
+        records = results[n * len(points):(n + 1) * len(points)]
+        manifest['inputs'][path] = {
+            'input_hash': input_id,
+            'points': len(points),
+            'reused': sum(1 for r in records if r.get('cached')),
+            'computed': sum(1 for r in records if r['status'] == 'ok' and not r.get('cached')),
+            'failed': sum(1 for r in records if r['status'] != 'ok'),
+            'seconds': {'lookup': lookup_seconds, 'total': time.perf_counter() - start},
+        }
+
+    manifest['finished'] = time.time()
+    if store is not None:
+        manifest['run_id'] = store.record_run(manifest)
+        manifest['store'] = store.stats()
+        store.close()
+    if args.output_dir:
+        with open(os.path.join(args.output_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    return results
+
+
+def cmd_bench(args, config):
+    overrides = config.get('params', {})
+    records = []
+    for path in args.inputs:
+        runs = []
+        try:
+            with pipeline.model_output(args.verbose):
+                for _ in range(args.repeat):
+                    timings = {}
+                    start = time.perf_counter()
+                    pipeline.run_pipeline(path, overrides, timings=timings)
+                    timings['total'] = time.perf_counter() - start
+                    runs.append(timings)
+        except Exception as e:
+            records.append({'input': path, 'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            if args.verbose:
+                traceback.print_exc(file=sys.stderr)
+            continue
+        records.append({
+            'input': path,
+            'status': 'ok',
+            'repeat': args.repeat,
+            'seconds': {stage: {'min': min(run[stage] for run in runs),
+                                'median': statistics.median(run[stage] for run in runs)}
+                        for stage in runs[0]},
+        })
+    return records
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='acaes', description="Wind-CAES pipeline runner")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('run', "run the pipeline on each input file"),
+                            ('sweep', "run the parameter grid of the config on each input file"),
+                            ('bench', "time each pipeline stage")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('inputs', nargs='+', help="wind data files (.xlsx, .csv or .parquet)")
+        p.add_argument('-c', '--config', help="JSON config file")
+        p.add_argument('-v', '--verbose', action='store_true', help="print model output to stderr")
+        if name == 'bench':
+            p.add_argument('-r', '--repeat', type=positive_int, default=3, help="repetitions per input (default 3)")
+            continue
+        p.add_argument('-o', '--output-dir', help="directory for result files and summary.json")
+        p.add_argument('-j', '--jobs', type=positive_int, default=os.cpu_count() or 1, help="worker processes")
+        p.add_argument('-f', '--format', choices=('csv', 'parquet', 'none'), default='csv',
+                       help="format of the per-run result files")
+        if name == 'sweep':
+            p.add_argument('--keep-results', action='store_true',
+                           help="also write the full result table of every sweep point (in --format)")
+            p.add_argument('--cycles', action='store_true',
+                           help="add rainflow cycle counts and pressure swing histograms to each summary")
+            p.add_argument('--store', help="result store (SQLite file): reuse stored sweep points and add new ones")
+            p.add_argument('--settle', choices=('day', 'month', 'year', 'all'),
+                           help="add a multi-market settlement per period (see \"settlement\" in the config)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+    if getattr(args, 'output_dir', None):
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    commands = {'run': cmd_run, 'sweep': cmd_sweep, 'bench': cmd_bench}
+    results = commands[args.command](args, config)
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    report = {
+        'command': args.command,
+        'config': args.config,
+        'runs': len(results),
+        'failed': failed,
+        'seconds': time.perf_counter() - start,
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if getattr(args, 'output_dir', None):
+        with open(os.path.join(args.output_dir, 'summary.json'), 'w') as f:
+            f.write(text)
+    print(text)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+archive_pipeline.py
+
+Out-of-core driver for multi-site, multi-decade wind archives.
+
+Usage:
+    python archive_pipeline.py ARCHIVE [--config CONFIG] [--jobs 16] [--block-hours 8760] [--output-dir DIR]
+
+ARCHIVE is a directory with one file per site (site name = file name) or one
+sub-directory per site holding consecutive time blocks (e.g. 1991.parquet,
+1992.parquet, ...; read in name order). Files are .csv, .parquet or .xlsx
+with hourly 'windspeed', 'temp' and 'price' columns. The config is the JSON
+of acaes.py; its "sweep" grid is run as scenarios of every site.
+
+Each worker process takes one site at a time and streams it in blocks of
+--block-hours rows: the wind and compressor stages run vectorized on the
+block, then the batched dispatch continues from the storage state at the end
+of the previous block, and only per-scenario totals are kept. Memory per
+worker is bounded by the block size (17 x 8 bytes per hour, the dispatch
+keeps no trajectories), whatever the length of the archive.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import pipeline
+import revenue
+from data_plane import StageBuffer, layout
+from acaes import load_config, sweep_points
+
+ARCHIVE_EXTENSIONS = ('.csv', '.parquet', '.pq', '.xlsx', '.xls')
+
+
+def discover_sites(archive):
+    """Maps site name → list of its files (in time order)."""
+    sites = {}
+    for entry in sorted(os.listdir(archive)):
+        path = os.path.join(archive, entry)
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                     if f.lower().endswith(ARCHIVE_EXTENSIONS)]
+            if files:
+                sites[entry] = files
+        elif entry.lower().endswith(ARCHIVE_EXTENSIONS):
+            sites[os.path.splitext(entry)[0]] = [path]
+    return sites
+
+
+def read_blocks(files, block_hours):
+    """
+    Yields the hourly rows of a site's files as DataFrames of at most
+    block_hours rows, without loading more than one block (CSV, Parquet with
+    pyarrow) or one file (Excel) at a time.
+    """
+    for path in files:
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.csv':
+            yield from pd.read_csv(path, chunksize=block_hours, usecols=lambda c: c in pipeline.RAW_COLUMNS)
+        elif ext in ('.parquet', '.pq'):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                df = pd.read_parquet(path, columns=list(pipeline.RAW_COLUMNS))
+                for start in range(0, len(df), block_hours):
+                    yield df.iloc[start:start + block_hours]
+            else:
+                for batch in pq.ParquetFile(path).iter_batches(block_hours, columns=list(pipeline.RAW_COLUMNS)):
+                    yield batch.to_pandas()
+        else:
+            df = pipeline.read_input(path)
+            for start in range(0, len(df), block_hours):
+                yield df.iloc[start:start + block_hours]
+
+
+def run_site(task):
+    """
+    Streams one site through the pipeline and reduces it to per-scenario
+    revenue totals, operating mode shares and the wind capacity factor.
+    """
+    site, files, points, block_hours = task['site'], task['files'], task['points'], task['block_hours']
+    start = time.perf_counter()
+    groups = pipeline.group_points(points)
+    totals = {col: np.zeros(len(points)) for col in revenue.OUTPUT_COLUMNS + ('Grid_import_kWh',)}
+    mode_hours = np.zeros((len(points), 7))
+    states = [None] * len(groups)
+    hours = 0
+    wind_kWh = 0.0
+    inputs = None
+    try:
+        with pipeline.model_output(task['verbose']):
+            for block in read_blocks(files, block_hours):
+                n = len(block)
+                if inputs is None or inputs.n_hours != n:
+                    # The input buffer is reused for every full block of the site
+                    inputs = StageBuffer(layout(pipeline.PREPROCESSED_COLUMNS, n))
+                inputs.load_frame(block)
+                for g, (fixed, indices, batch) in enumerate(groups):
+                    pipeline.preprocess_buffer(inputs, fixed)
+                    # Summary-only dispatch: totals are accumulated in the kernel
+                    block_totals, states[g] = pipeline.run_totals(inputs, batch, fixed, states[g])
+                    for col, values in totals.items():
+                        values[indices] += block_totals[col]
+                    mode_hours[indices] += block_totals['mode_hours']
+                hours += n
+                wind_kWh += float(inputs['Total_Power_Output'].sum())
+    except Exception as e:
+        if task['verbose']:
+            traceback.print_exc(file=sys.stderr)
+        return [{'site': site, 'params': point, 'status': 'error', 'error': f"{type(e).__name__}: {e}",
+                 'seconds': time.perf_counter() - start} for point in points]
+
+    capacity_factor = pipeline.capacity_factor(wind_kWh, hours)
+    # Same summary schema as acaes.py (pipeline.summary_record)
+    return [{'site': site, 'params': point, 'status': 'ok',
+             'summary': pipeline.summary_record(totals, i, hours, capacity_factor, mode_hours[i]),
+             'seconds': time.perf_counter() - start}
+            for i, point in enumerate(points)]
+
+
+def site_table(records):
+    """Flat per-site table (one row per site and sweep point) of the successful records."""
+    rows = []
+    for r in records:
+        if r['status'] == 'ok':
+            row = {'site': r['site'], **r['params']}
+            row.update({k: v for k, v in r['summary'].items() if k != 'operating_mode_pct'})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_archive(archive, points=None, jobs=None, block_hours=8760, verbose=False):
+    """
+    Runs every site of an archive directory with a pool of worker processes.
+
+    Parameters:
+        archive (str): archive directory (see module docstring)
+        points (list): override dicts, one per scenario (default: params.py as is)
+        jobs (int): worker processes (default: all cores)
+        block_hours (int): rows per streamed block
+
+    Returns:
+        list of per-site, per-scenario records.
+    """
+    points = points or [{}]
+    tasks = [{'site': site, 'files': files, 'points': points, 'block_hours': block_hours, 'verbose': verbose}
+             for site, files in discover_sites(archive).items()]
+    jobs = min(jobs or os.cpu_count() or 1, max(len(tasks), 1))
+    if jobs == 1:
+        return [r for task in tasks for r in run_site(task)]
+    # One site per task, handed out as workers become free; workers are
+    # recycled now and then so that memory fragmentation cannot build up
+    with Pool(processes=jobs, maxtasksperchild=32) as pool:
+        return [r for site_records in pool.imap(run_site, tasks) for r in site_records]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Out-of-core multi-site Wind-CAES archive runner")
+    parser.add_argument('archive', help="directory with one file or sub-directory per site")
+    parser.add_argument('-c', '--config', help="JSON config file (params and sweep, as for acaes.py)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('-b', '--block-hours', type=int, default=8760, help="rows per streamed block (default 8760)")
+    parser.add_argument('-o', '--output-dir', help="directory for sites.csv and summary.json")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print model output to stderr")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    start = time.perf_counter()
+    results = run_archive(args.archive, sweep_points(config), args.jobs, args.block_hours, args.verbose)
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    report = {
+        'command': 'archive',
+        'archive': args.archive,
+        'config': args.config,
+        'sites': len({r['site'] for r in results}),
+        'runs': len(results),
+        'failed': failed,
+        'seconds': time.perf_counter() - start,
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        with open(os.path.join(args.output_dir, 'summary.json'), 'w') as f:
+            f.write(text)
+        site_table(results).to_csv(os.path.join(args.output_dir, 'sites.csv'), index=False)
+    print(text)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
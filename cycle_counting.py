@@ -0,0 +1,191 @@
+import numpy as np
+
+
+class StreamingRainflow:
+    """
+    Streaming rainflow cycle counter for a batch of signals (one per scenario).
+
+    Samples are quantized to n_levels steps of full_scale, which also acts as
+    a hysteresis filter. The residual stack of a rainflow count over quantized
+    levels never holds more than 2 * n_levels + 2 reversals, so the stacks of
+    all scenarios are one fixed (scenarios, 2 * n_levels + 3) array with a
+    depth per scenario. Samples are collected in blocks of block hours; a
+    full block is quantized and searched for reversals at once, and the
+    reversals are then fed to the stacks as masked array operations over the
+    scenarios, the k-th reversal of every scenario in one step. Counted
+    cycles are binned by range (in fractions of full_scale); half cycles
+    count 0.5.
+
+    Parameters:
+        n_scenarios (int): number of signals updated together
+        full_scale (float or array): signal value that corresponds to a range of 1
+        n_levels (int): quantization levels over full_scale
+        n_bins (int): histogram bins over ranges 0..1
+        block (int): samples buffered per vectorized step
+    """
+
+    def __init__(self, n_scenarios, full_scale, n_levels=64, n_bins=10, block=256):
+        self.n_levels = n_levels
+        self.n_bins = n_bins
+        self.scale = n_levels / np.broadcast_to(np.asarray(full_scale, dtype=float), (n_scenarios,))
+        self.last = np.full(n_scenarios, -1, dtype=int)
+        self.direction = np.zeros(n_scenarios, dtype=int)
+        # One slot above the bound for the reversal pushed before the check
+        self.stacks = np.zeros((n_scenarios, 2 * n_levels + 3), dtype=int)
+        self.depth = np.zeros(n_scenarios, dtype=int)
+        self.histogram = np.zeros((n_scenarios, n_bins))
+        self.cycles = np.zeros(n_scenarios)
+        self.damage_sum = np.zeros(n_scenarios)  # Σ cycles x range: equivalent full cycles
+        self.max_range = np.zeros(n_scenarios)
+        self.pending = np.empty((block, n_scenarios))
+        self.n_pending = 0
+
+    def _count(self, rows, levels, weight):
+        # rows are distinct, so plain fancy-indexed updates accumulate correctly
+        fraction = levels / self.n_levels
+        bins = np.minimum((fraction * self.n_bins).astype(int), self.n_bins - 1)
+        self.histogram[rows, bins] += weight
+        self.cycles[rows] += weight
+        self.damage_sum[rows] += weight * fraction
+        self.max_range[rows] = np.maximum(self.max_range[rows], fraction)
+
+    def _reversal(self, rows, levels):
+        # Three-point rainflow check (ASTM E1049) on the confirmed reversals,
+        # repeated on the scenarios that popped until none can pop
+        self.stacks[rows, self.depth[rows]] = levels
+        self.depth[rows] += 1
+        while len(rows):
+            depth = self.depth[rows]
+            rows, depth = rows[depth >= 3], depth[depth >= 3]
+            top = self.stacks[rows, depth - 1]
+            middle = self.stacks[rows, depth - 2]
+            bottom = self.stacks[rows, depth - 3]
+            x = np.abs(top - middle)
+            y = np.abs(middle - bottom)
+            pop = x >= y
+            rows, depth, top, y = rows[pop], depth[pop], top[pop], y[pop]
+            half = depth == 3
+            if half.any():
+                # Half cycle: drop the first point of a three-point stack
+                first = rows[half]
+                self._count(first, y[half], 0.5)
+                self.stacks[first, :2] = self.stacks[first, 1:3]
+                self.depth[first] -= 1
+                full = ~half
+                rows, depth, top, y = rows[full], depth[full], top[full], y[full]
+            # Full cycle: drop the two points below the top
+            self._count(rows, y, 1.0)
+            self.stacks[rows, depth - 3] = top
+            self.depth[rows] -= 2
+
+    def update(self, values):
+        """Feeds one sample per scenario."""
+        self.pending[self.n_pending] = values
+        self.n_pending += 1
+        if self.n_pending == len(self.pending):
+            self._flush()
+
+    def _flush(self):
+        level = np.clip(np.rint(self.pending[:self.n_pending] * self.scale), 0, self.n_levels).astype(int)
+        self.n_pending = 0
+        # Quantized signal stays at a level between samples, so the previous
+        # sample's level is the last extreme of a reversal
+        previous = np.concatenate((self.last[None], level[:-1]))
+        step = np.sign(level - previous)
+        started = previous[0] < 0
+        if started.any():
+            self.stacks[started, 0] = level[0, started]
+            self.depth[started] = 1
+            step[0, started] = 0
+        # Direction of the last move before each sample (forward fill of the
+        # nonzero steps, starting from the direction of the previous block)
+        moved = step != 0
+        hours = np.arange(len(level))[:, None]
+        last_move = np.maximum.accumulate(np.where(moved, hours, -1), axis=0)
+        direction = np.where(last_move >= 0, np.take_along_axis(step, np.maximum(last_move, 0), axis=0),
+                             self.direction)
+        before = np.concatenate((self.direction[None], direction[:-1]))
+        reversed_ = moved & (step == -before)
+        # Reversals in time order per scenario: the k-th of every scenario at once
+        rows, hour = np.nonzero(reversed_.T)
+        counts = np.bincount(rows, minlength=len(self.last))
+        first = np.cumsum(counts) - counts
+        for k in range(counts.max(initial=0)):
+            has = np.flatnonzero(counts > k)
+            self._reversal(has, previous[hour[first[has] + k], has])
+        self.direction = direction[-1]
+        self.last = level[-1]
+
+    def residual(self):
+        """
+        Adds the last point as a final reversal (with the three-point check),
+        counts the residual stack as half cycles and returns the histograms
+        (the counter should not be updated afterwards).
+        """
+        if self.n_pending:
+            self._flush()
+        rows = np.arange(len(self.depth))
+        top = self.stacks[rows, np.maximum(self.depth - 1, 0)]
+        tail = (self.last >= 0) & ((self.depth == 0) | (top != self.last))
+        self._reversal(np.flatnonzero(tail), self.last[tail])
+        for j in range(self.stacks.shape[1] - 1):
+            pair = np.flatnonzero(self.depth > j + 1)
+            if not len(pair):
+                break
+            self._count(pair, np.abs(self.stacks[pair, j + 1] - self.stacks[pair, j]), 0.5)
+        self.depth[:] = 0
+        return self.histogram
+
+
+class DispatchAnalytics:
+    """
+    Degradation and cycling statistics accumulated inside dispatch_stage.
+
+    Tracks rainflow cycles of the CAES and TES state of charge and a
+    histogram of cavern pressure swings, one sample per hour per scenario,
+    without keeping the trajectories.
+
+    Parameters:
+        n_levels (int): quantization levels of the rainflow counters
+        n_bins (int): depth-of-discharge / pressure swing histogram bins
+    """
+
+    def __init__(self, n_levels=64, n_bins=10):
+        self.n_levels = n_levels
+        self.n_bins = n_bins
+        self.caes = None
+
+    def start(self, n_scenarios, settings):
+        """Sizes the counters for a dispatch run (called by dispatch_stage with its resolved settings)."""
+        s = settings
+        max_CAES_cap = s['P_max_s'] * s['V_pore_s'] / (s['T_s'] * s['R_specific'])
+        self.pressure_span_Pa = np.broadcast_to(s['P_max_s'] - s['P_amb'], (n_scenarios,))
+        self.p_amb = s['P_amb']
+        self.caes = StreamingRainflow(n_scenarios, max_CAES_cap, self.n_levels, self.n_bins)
+        self.tes = StreamingRainflow(n_scenarios, s['TES_cap'], self.n_levels, self.n_bins)
+        self.pressure = StreamingRainflow(n_scenarios, self.pressure_span_Pa, self.n_levels, self.n_bins)
+
+    def update(self, storage_kg, tes_kWh, p_cav):
+        self.caes.update(storage_kg)
+        self.tes.update(tes_kWh)
+        self.pressure.update(p_cav - self.p_amb)
+
+    def results(self):
+        """Per-scenario records (lists of plain floats, JSON-serializable)."""
+        caes_hist = self.caes.residual()
+        tes_hist = self.tes.residual()
+        pressure_hist = self.pressure.residual()
+        edges_bar = [list(np.linspace(0, span, self.n_bins + 1) / 1e5) for span in self.pressure_span_Pa]
+        return [{
+            'equivalent_full_cycles_CAES': float(self.caes.damage_sum[k]),
+            'equivalent_full_cycles_TES': float(self.tes.damage_sum[k]),
+            'cycle_count_CAES': float(self.caes.cycles[k]),
+            'cycle_count_TES': float(self.tes.cycles[k]),
+            'max_depth_of_discharge_CAES': float(self.caes.max_range[k]),
+            'max_depth_of_discharge_TES': float(self.tes.max_range[k]),
+            'depth_of_discharge_histogram_CAES': caes_hist[k].tolist(),
+            'depth_of_discharge_histogram_TES': tes_hist[k].tolist(),
+            'pressure_swing_histogram': pressure_hist[k].tolist(),
+            'pressure_swing_bin_edges_bar': [float(e) for e in edges_bar[k]],
+            'max_pressure_swing_bar': float(self.pressure.max_range[k] * self.pressure_span_Pa[k] / 1e5),
+        } for k in range(len(caes_hist))]
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+
+
+def _attach_shared_memory(name):
+    """
+    Opens an existing shared memory segment without registering it with this
+    process's resource tracker: the creating process owns the segment, and a
+    spawned worker's tracker would otherwise unlink it when the worker exits.
+    """
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class StageBuffer:
+    """
+    Preallocated struct-of-arrays buffer shared by the pipeline stages.
+
+    Every column is a float64 NumPy view into one contiguous block, so stages
+    read and write columns in place instead of returning new DataFrames. The
+    block lives on the heap, in multiprocessing.shared_memory ('shm') or in a
+    memory-mapped file ('memmap'); for the last two, other processes attach to
+    the same memory through spec() and StageBuffer.attach() without pickling
+    any data.
+
+    Parameters:
+        layout (dict): column name → shape, e.g. {'price': (8760,), 'Grid_transfer_kWh': (4, 8760)}
+        backing (str): 'heap', 'shm' or 'memmap'
+        path (str): file for the 'memmap' backing
+    """
+
+    def __init__(self, layout, backing='heap', path=None, _attach=None):
+        self.layout = {name: tuple(int(n) for n in shape) for name, shape in layout.items()}
+        self.backing = backing
+        self.path = path
+        self._shm = None
+        self._owner = _attach is None
+        size = sum(int(np.prod(shape)) for shape in self.layout.values())
+
+        if backing == 'heap':
+            block = np.zeros(size)
+        elif backing == 'shm':
+            if _attach is None:
+                self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * 8)
+            else:
+                self._shm = _attach_shared_memory(_attach)
+            block = np.ndarray((size,), dtype=np.float64, buffer=self._shm.buf)
+            if _attach is None:
+                block[:] = 0.0
+        elif backing == 'memmap':
+            if path is None:
+                raise ValueError("The 'memmap' backing needs a file path")
+            mode = 'w+' if _attach is None else 'r+'
+            block = np.memmap(path, dtype=np.float64, mode=mode, shape=(max(size, 1),))[:size]
+        else:
+            raise ValueError(f"Unknown backing: {backing}")
+
+        self.block = block
+        self.columns = {}
+        offset = 0
+        for name, shape in self.layout.items():
+            n = int(np.prod(shape))
+            self.columns[name] = block[offset:offset + n].reshape(shape)
+            offset += n
+
+    @classmethod
+    def attach(cls, spec):
+        """Attaches to a buffer created in another process from its spec()."""
+        return cls(spec['layout'], spec['backing'], spec.get('path'), _attach=spec.get('name', True))
+
+    def spec(self):
+        """Picklable description of the buffer for StageBuffer.attach()."""
+        if self.backing == 'heap':
+            raise ValueError("Heap buffers cannot be shared between processes")
+        spec = {'layout': self.layout, 'backing': self.backing, 'path': self.path}
+        if self._shm is not None:
+            spec['name'] = self._shm.name
+        return spec
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def keys(self):
+        return self.columns.keys()
+
+    @property
+    def n_hours(self):
+        return next(iter(self.layout.values()))[-1]
+
+    def to_frame(self, scenario=0, columns=None):
+        """
+        Copies the buffer (one scenario of the 2-D columns) into a DataFrame.
+        """
+        data = {}
+        for name in columns or self.columns:
+            col = self.columns[name]
+            data[name] = col[scenario] if col.ndim == 2 else col
+        return pd.DataFrame(data)
+
+    def load_frame(self, df):
+        """Copies the matching 1-D columns of a DataFrame into the buffer."""
+        for name, col in self.columns.items():
+            if col.ndim == 1 and name in df:
+                col[:] = df[name].to_numpy(dtype=float)
+        return self
+
+    def close(self):
+        """Releases this process's mapping; the creating process also frees shared memory."""
+        self.columns = {}
+        self.block = None
+        if self._shm is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def layout(columns, n_hours, n_scenarios=None):
+    """Layout dict for columns of shape (hours,) or, with n_scenarios, (scenarios, hours)."""
+    shape = (n_hours,) if n_scenarios is None else (n_scenarios, n_hours)
+    return {name: shape for name in columns}
@@ -0,0 +1,99 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Part-load efficiency maps of the compressor and the expander.
+#
+# A map is a 2-D table of efficiency [decimal] over load fraction (power /
+# rated power) and pressure ratio. It is given in params.py as a file path
+# (.csv or .npz) or inline as {"load": [...], "pressure_ratio": [...],
+# "eta": [[...], ...]} with one row of eta per load. In a .csv the first
+# column holds the load fractions and the header the pressure ratios:
+#
+#     load,10,20,30
+#     0.2,0.62,0.60,0.57
+#     0.5,0.80,0.79,0.77
+#     1.0,0.88,0.87,0.86
+#
+# An .npz holds the arrays 'load', 'pressure_ratio' and 'eta'. Lookups are
+# vectorized bilinear interpolations over arrays of any shape (hours,
+# scenarios), so the compressor stage and the dispatch kernel evaluate a map
+# for all rows at once.
+
+
+class EfficiencyMap:
+    """
+    Bilinear interpolation of efficiency on a (load fraction x pressure ratio) grid.
+
+    Lookups broadcast like ufuncs. Outside the grid the value at the nearest
+    edge is used (no extrapolation).
+    """
+
+    def __init__(self, load, pressure_ratio, eta):
+        load = np.asarray(load, dtype=float)
+        pressure_ratio = np.asarray(pressure_ratio, dtype=float)
+        eta = np.asarray(eta, dtype=float)
+        if load.ndim != 1 or pressure_ratio.ndim != 1 or eta.shape != (len(load), len(pressure_ratio)):
+            raise ValueError(f"Efficiency map: eta must have shape (loads, pressure ratios) = "
+                             f"({len(load)}, {len(pressure_ratio)}), got {eta.shape}")
+        if np.any(np.diff(load) <= 0) or np.any(np.diff(pressure_ratio) <= 0):
+            raise ValueError("Efficiency map: load and pressure ratio must be strictly increasing")
+        if not np.all((eta > 0) & (eta <= 1)):
+            raise ValueError("Efficiency map: efficiencies must be in (0, 1]")
+        # A single load or pressure ratio makes the map constant along that axis
+        if len(load) == 1:
+            load, eta = np.r_[load, load + 1], np.repeat(eta, 2, axis=0)
+        if len(pressure_ratio) == 1:
+            pressure_ratio, eta = np.r_[pressure_ratio, pressure_ratio + 1], np.repeat(eta, 2, axis=1)
+        self.load = load
+        self.pressure_ratio = pressure_ratio
+        self.eta = eta
+        # Per axis: inner grid points (cell search) and the fraction within
+        # cell i as x * scale[i] - offset[i]
+        self._axes = [(grid[1:-1], np.array((1 / np.diff(grid), grid[:-1] / np.diff(grid))))
+                      for grid in (load, pressure_ratio)]
+        # Per cell: eta = a + b fx + c fy + d fx fy, so that a lookup gathers
+        # one column of coefficients instead of four corners
+        e00, e01, e10, e11 = eta[:-1, :-1], eta[:-1, 1:], eta[1:, :-1], eta[1:, 1:]
+        self._coefficients = np.array([e00, e10 - e00, e01 - e00, e11 - e10 - e01 + e00]).reshape(4, -1)
+
+    def _cell(self, axis, x):
+        inner, factors = self._axes[axis]
+        x = np.asarray(x, dtype=float)
+        i = np.searchsorted(inner, x, side='right')
+        scale, offset = factors.take(i, axis=1)
+        return i, np.minimum(np.maximum(x * scale - offset, 0.0), 1.0)
+
+    def __call__(self, load, pressure_ratio):
+        i, fx = self._cell(0, load)
+        j, fy = self._cell(1, pressure_ratio)
+        a, b, c, d = self._coefficients.take(i * (len(self.pressure_ratio) - 1) + j, axis=1)
+        return a + fx * (b + d * fy) + c * fy
+
+
+def load_efficiency_map(path):
+    """Reads an efficiency map from a .csv or .npz file (see the format above)."""
+    if os.path.splitext(path)[1].lower() == '.npz':
+        with np.load(path) as data:
+            return EfficiencyMap(data['load'], data['pressure_ratio'], data['eta'])
+    table = pd.read_csv(path, index_col=0)
+    return EfficiencyMap(table.index.to_numpy(dtype=float), table.columns.astype(float), table.to_numpy(dtype=float))
+
+
+_maps = {}
+
+
+def get_efficiency_map(spec):
+    """
+    Returns the EfficiencyMap of a params.py setting: None (constant
+    efficiency), a file path (cached per path and modification time) or an
+    inline dict with 'load', 'pressure_ratio' and 'eta'.
+    """
+    if spec is None or isinstance(spec, EfficiencyMap):
+        return spec
+    if isinstance(spec, dict):
+        return EfficiencyMap(spec['load'], spec['pressure_ratio'], spec['eta'])
+    key = (os.path.abspath(spec), os.stat(spec).st_mtime_ns)
+    if key not in _maps:
+        _maps[key] = load_efficiency_map(spec)
+    return _maps[key]
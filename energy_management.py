@@ -1,180 +1,390 @@
 import pandas as pd
 import numpy as np
 from params import (
-    R_specific,           
-    P_max_s,    
-    T_s,         
-    V_pore_s,    
-    cp,          
-    gamma,       
-    P_amb,       
+    R_specific,
+    P_max_s,
+    T_s,
+    V_pore_s,
+    cp,
+    gamma,
+    P_amb,
     turbine_capacity,
     TES_cap,
     CAES_loss,
     TES_loss,
     eta_t,
-    charge_threshold, 
-    discharge_threshold
+    charge_threshold,
+    discharge_threshold,
+    real_gas,
+    T_inj,
+    property_table_file,
+    eta_comp,
+    eta_trans,
+    eta_TES,
+    grid_charging,
+    grid_import_limit,
+    grid_import_tariff,
+    P1,
+    P2,
+    compressor_map,
+    compressor_capacity,
+    expander_map
 )
+from real_gas_properties import get_property_table
+from efficiency_maps import get_efficiency_map
+
+# Per-hour inputs read by the dispatch (from the wind and compressor stages)
+INPUT_COLUMNS = ('price', 'Total_Power_Output', 'E_elec_kWh', 'm_air_kg', 'E_TES_kWh', 'T2_K', 'Delta_h_kJ_per_kg',
+                 'Compressor_Efficiency')
+
+# Tracking columns written by the dispatch, one row per scenario
+OUTPUT_COLUMNS = (
+    'Grid_transfer_kWh',
+    'CAES_charging_kg','TES_charging_kWh',
+    'Cumulative_CAES_storage_kg','Cumulative_TES_storage_kWh',
+    'CAES_loss_kg','TES_loss_kWh',
+    'CAES_discharged_kg','TES_discharged_kWh',
+    'Cumulative_CAES_discharged_kg','Cumulative_TES_discharged_kWh',
+    'Cumulative_Grid_transfer_kWh',
+    'Cavern_Pressure_Pa','Cavern_Temperature_K',
+    'Grid_import_kWh',
+    'Operating_Mode'
+)
+
+# Inputs that dispatch_stage can take from forecasts for its decisions (forecast=...)
+FORECAST_COLUMNS = ('price', 'Total_Power_Output')
+
+# Per-scenario totals accumulated by dispatch_stage in summary mode (totals=...)
+FLOW_TOTALS = (
+    'CAES_charging_kg', 'CAES_discharged_kg', 'TES_charging_kWh', 'TES_discharged_kWh',
+    'Grid_transfer_kWh', 'Grid_import_kWh', 'CAES_loss_kg', 'TES_loss_kWh',
+)
+REVENUE_TOTALS = ('Revenue_without_storage', 'Revenue_from_storage', 'Revenue_from_grid',
+                  'Grid_import_cost', 'Total_Revenue')
+
+# Parameters that may differ between the scenarios of one batched dispatch run.
+# Each one is a scalar or an array with one value per scenario.
+BATCH_PARAMS = (
+    'charge_threshold', 'discharge_threshold',
+    'turbine_capacity', 'TES_cap', 'CAES_loss', 'TES_loss', 'eta_t',
+    'R_specific', 'P_max_s', 'T_s', 'V_pore_s', 'cp', 'gamma', 'P_amb', 'T_inj',
+    'grid_charging', 'grid_import_limit', 'grid_import_tariff',
+)
+
+
+def dispatch_settings(settings=None):
+    """
+    Resolves the BATCH_PARAMS of a dispatch run: the values in settings
+    (scalars or per-scenario arrays) or else the current module values.
+    """
+    settings = settings or {}
+    current = globals()
+    return {name: np.asarray(settings.get(name, current[name]), dtype=float) for name in BATCH_PARAMS}
+
+
+def initial_state(n_scenarios=1, settings=None):
+    """Empty storage at the start of a run (one entry per scenario)."""
+    s = dispatch_settings(settings)
+    zeros = np.zeros(n_scenarios)
+    return {
+        'CAES_storage_kg': zeros.copy(),
+        'TES_storage_kWh': zeros.copy(),
+        'CAES_discharged_kg': zeros.copy(),
+        'TES_discharged_kWh': zeros.copy(),
+        'Grid_transfer_kWh': zeros.copy(),
+        'Cavern_Temperature_K': zeros + s['T_s'],
+    }
 
-# Function to allocate and accumulate energy storage with 0.005% hourly loss, charging and discharging
-def allocate_energy_storage(df, charge_threshold=charge_threshold, discharge_threshold=discharge_threshold):
-  
-    max_CAES_cap = P_max_s * V_pore_s / ((T_s)* R_specific)
-
-    P_cav  = P_max_s  
-
-    # Discharge rates per hour
-    
-    tes_discharge_rate = turbine_capacity      # kW (this is the total cap of expander)
-    
-    # Max TES Capacity
-    max_TES_cap = TES_cap # kWh
-
-    # Initialize all tracking columns
-    for col in [
-        'Grid_transfer_kWh',
-        'CAES_charging_kg','TES_charging_kWh',
-        'Cumulative_CAES_storage_kg','Cumulative_TES_storage_kWh',
-        'CAES_loss_kg','TES_loss_kWh',   
-        'CAES_discharged_kg','TES_discharged_kWh',
-        'Cumulative_CAES_discharged_kg','Cumulative_TES_discharged_kWh',
-        'Cumulative_Grid_transfer_kWh',
-        'Operating_Mode'
-
-    ]:
-        df[col] = 0.0
-
-    current_storage_kg = 0.0
-    current_TES_storage_kWh = 0.0
-    total_discharged_kg = 0.0
-    total_discharged_kWh = 0.0
-    total_to_Grid_kWh = 0.0
-
-    for idx, row in df.iterrows():
-        price = row.get('price', 0.0)
-        elec_prod = row.get('Total_Power_Output', 0.0)
+
+def dispatch_stage(inputs, out=None, settings=None, state=None, analytics=None, totals=None, forecast=None):
+    """
+    Array dispatch kernel: allocates and accumulates energy storage hour by
+    hour for a batch of scenarios at once.
+
+    The time loop is sequential (the storage state carries over), while each
+    step is vectorized across scenarios, so a sweep over thresholds or
+    capacities costs one pass over the hours instead of one pass per point.
+
+    Parameters:
+        inputs (mapping): INPUT_COLUMNS as arrays of shape (hours,) shared by all
+                          scenarios or (scenarios, hours); a StageBuffer works directly.
+        out (mapping): optional OUTPUT_COLUMNS arrays of shape (scenarios, hours)
+                       that receive the trajectories (written in place).
+        settings (dict): BATCH_PARAMS overrides, scalars or per-scenario arrays.
+        state (dict): storage state to start from (see initial_state), scalars
+                      or per-scenario arrays; the default is empty storage.
+        analytics: optional cycle_counting.DispatchAnalytics that accumulates
+                   rainflow cycles and pressure swings during the pass.
+        totals (dict): summary mode; receives per-scenario arrays accumulated
+                       during the pass: FLOW_TOTALS, REVENUE_TOTALS (€, as in
+                       revenue.calculate_revenue), 'mode_hours' (scenarios x 7),
+                       min/max CAES and TES storage, 'Max_Cavern_Pressure_Pa' and
+                       hours with TES full / empty. Use with out=None to keep
+                       no trajectories at all.
+        forecast (mapping): optional 'price' and 'Total_Power_Output' forecasts,
+                            (hours,) or (scenarios, hours), e.g. one ensemble
+                            member per scenario. The operating mode is then
+                            decided on the forecasts while energy flows follow
+                            the actual wind and revenue uses the actual price.
+
+    With an expander_map in params.py the expander efficiency of every hour
+    and scenario comes from the map at the load fraction tes_out /
+    turbine_capacity and the pressure ratio p_cav / P_amb. The air and heat
+    drawn from storage stay those of the rated efficiency eta_t, and the
+    exported energy (TES_discharged_kWh, its running total in
+    Cumulative_TES_discharged_kWh and the state, and so revenue from storage)
+    is tes_out * efficiency / eta_t: part-load losses cost sales, not storage.
+    With a compressor_map, grid charging (mode 6) uses the compressor
+    efficiency at the import load instead of eta_comp.
+
+    Returns:
+        dict with the storage state after the last hour (same keys as initial_state).
+    """
+    s = dispatch_settings(settings)
+    columns = {name: np.atleast_2d(np.asarray(inputs[name], dtype=float)) for name in INPUT_COLUMNS}
+    decision = {name: np.atleast_2d(np.asarray(forecast[name], dtype=float)) if forecast is not None else columns[name]
+                for name in FORECAST_COLUMNS}
+    n_hours = columns['price'].shape[1]
+    n_scenarios = max([len(np.atleast_1d(v)) for v in s.values()] +
+                      [c.shape[0] for c in columns.values()] +
+                      [c.shape[0] for c in decision.values()] +
+                      [len(np.atleast_1d(v)) for v in (state or {}).values()] +
+                      [len(out[OUTPUT_COLUMNS[0]]) if out is not None else 1])
+    state = initial_state(n_scenarios, settings) if state is None else state
+    if analytics is not None:
+        analytics.start(n_scenarios, s)
+    record = out is not None or analytics is not None or totals is not None
+    if totals is not None:
+        flow_sums = np.zeros((len(FLOW_TOTALS), n_scenarios))
+        sales = np.zeros((2, n_scenarios))          # price x (TES discharge, grid transfer)
+        import_cost = np.zeros(n_scenarios)
+        mode_hours = np.zeros((5, n_scenarios))     # modes 1, 2, 3, 4 and 6; mode 5 is the rest
+        storage_min = np.full((2, n_scenarios), np.inf)
+        storage_max = np.full((2, n_scenarios), -np.inf)
+        p_max = np.zeros(n_scenarios)
+        tes_hours = np.zeros((2, n_scenarios))      # TES full, TES empty
+
+    charge_th, discharge_th = s['charge_threshold'], s['discharge_threshold']
+    tes_discharge_rate = s['turbine_capacity']      # kW (this is the total cap of expander)
+    max_TES_cap = s['TES_cap']                      # kWh
+    eta = s['eta_t']
+    exponent = (s['gamma'] - 1) / s['gamma']
+
+    # Grid charging: compressor + TES yield per kWh imported (as in Compressor_Model)
+    grid_charging_on = s['grid_charging'] != 0
+    import_cost_th = charge_th - s['grid_import_tariff']
+    eta_total = eta_comp * eta_trans
+    tes_per_kWh = eta_total * eta_TES
+
+    # Part-load efficiency maps, evaluated for all scenarios at every step
+    x_map = get_efficiency_map(expander_map)
+    c_map = get_efficiency_map(compressor_map)
+    rated = np.where(tes_discharge_rate > 0, tes_discharge_rate, 1.0)
+
+    # Real-gas cavern: Z(p, T) for the pressure, adiabatic cavern temperature,
+    # and the expansion enthalpy drop from the shared property table. The
+    # cavern holds a cushion of air at P_amb and T_s under the working mass.
+    if real_gas:
+        if s['P_amb'].ndim:
+            raise ValueError("P_amb must be the same for all scenarios with real_gas = True")
+        table = get_property_table(property_table_file)
+        p_amb = float(s['P_amb'])
+        cushion_kg = p_amb * s['V_pore_s'] / (table.Z(p_amb, s['T_s']) * s['R_specific'] * s['T_s'])
+
+    current_storage_kg = np.broadcast_to(state['CAES_storage_kg'], (n_scenarios,)).astype(float)
+    current_TES_storage_kWh = np.broadcast_to(state['TES_storage_kWh'], (n_scenarios,)).astype(float)
+    total_discharged_kg = np.broadcast_to(state['CAES_discharged_kg'], (n_scenarios,)).astype(float)
+    total_discharged_kWh = np.broadcast_to(state['TES_discharged_kWh'], (n_scenarios,)).astype(float)
+    total_to_Grid_kWh = np.broadcast_to(state['Grid_transfer_kWh'], (n_scenarios,)).astype(float)
+    cavern_T = np.broadcast_to(state['Cavern_Temperature_K'], (n_scenarios,)).astype(float)
+
+    price_col = columns['price']
+    elec_col = columns['Total_Power_Output']
+    decision_price_col = decision['price']
+    decision_elec_col = decision['Total_Power_Output']
+    E_elec_col = columns['E_elec_kWh']
+    m_air_col = columns['m_air_kg']
+    E_TES_col = columns['E_TES_kWh']
+    T2_col = columns['T2_K']
+    delta_h_col = columns['Delta_h_kJ_per_kg']
+    eta_c_col = columns['Compressor_Efficiency']
+
+    for t in range(n_hours):
+        # Decisions use the (forecast) price and wind; revenue the actual price
+        price = decision_price_col[:, t]
+        elec_prod = decision_elec_col[:, t]
+        actual_price = price_col[:, t]
+        E_elec = E_elec_col[:, t]
+        E_TES = E_TES_col[:, t]
+        T2 = T2_col[:, t]
 
         # TES OUT
-        tes_out = min(tes_discharge_rate, current_TES_storage_kWh)
+        tes_out = np.minimum(tes_discharge_rate, current_TES_storage_kWh)
 
         # Losses
-        caes_loss = CAES_loss * current_storage_kg
-        tes_loss = TES_loss * current_TES_storage_kWh
-        current_storage_kg -= caes_loss
-        current_TES_storage_kWh -= tes_loss
-        df.at[idx, 'CAES_loss_kg'] = caes_loss
-        df.at[idx, 'TES_loss_kWh'] = tes_loss
-
-        # 1) recompute real‐time cavern pressure (Pa)
-        p_cav = max(
-            (current_storage_kg * T_s * R_specific) / V_pore_s,
-            P_amb
-        )
-        
-        # 2) ideal enthalpy drop Δh in kJ/kg
-        T2 = row.get('T2_K', 0.0)
-        delta_h_kJ = cp * T2 * (1 - (P_amb / p_cav)**((gamma - 1) / gamma))
-        
+        caes_loss = s['CAES_loss'] * current_storage_kg
+        tes_loss = s['TES_loss'] * current_TES_storage_kWh
+        current_storage_kg = current_storage_kg - caes_loss
+        current_TES_storage_kWh = current_TES_storage_kWh - tes_loss
+
+        if real_gas:
+            # 1) real-gas cavern pressure (Pa) at the current cavern temperature
+            m_total = cushion_kg + current_storage_kg
+            p_cav = np.maximum(table.pressure(m_total, cavern_T, s['V_pore_s']), p_amb)
+
+            # 2) isentropic enthalpy drop Δh in kJ/kg from the property table
+            delta_h_kJ = np.where(p_cav > p_amb, table.isentropic_enthalpy_drop(p_cav, T2, p_amb), 0.0)
+        else:
+            # 1) recompute real‐time cavern pressure (Pa)
+            p_cav = np.maximum(current_storage_kg * s['T_s'] * s['R_specific'] / s['V_pore_s'], s['P_amb'])
+
+            # 2) ideal enthalpy drop Δh in kJ/kg
+            delta_h_kJ = s['cp'] * T2 * (1 - (s['P_amb'] / p_cav)**exponent)
+
         # 3) convert to kWh/kg and include turbine efficiency
-        delta_h_kWh_per_kg = eta_t * delta_h_kJ / 3600.0
-        
+        delta_h_kWh_per_kg = eta * delta_h_kJ / 3600.0
+        if x_map is not None:
+            # part-load map at this hour's expander load and cavern pressure
+            # ratio, relative to the rated efficiency
+            export_factor = x_map(tes_out / rated, p_cav / s['P_amb']) / eta
+
         # 4) discharge‐limited mass flow [kg] to supply tes_out [kWh]
-        if delta_h_kWh_per_kg > 0:
-            caes_discharge_rate = tes_out / delta_h_kWh_per_kg
-        else:
-            caes_discharge_rate = 0.0
-                
-        # if wind turbine generate electricty
-        if elec_prod > 0:
-
-            if price > discharge_threshold:
-
-                if current_storage_kg > 0 or current_TES_storage_kWh > 0:
-
-                    # OPERATING MODE 1 (STORAGE AND WIND -----> GRID)
-                    df.at[idx, 'Operating_Mode'] = 1
-
-                    # TES discharge
-                    current_TES_storage_kWh -= tes_out
-                    total_discharged_kWh += tes_out
-                    total_to_Grid_kWh += row.get('E_elec_kWh', 0.0)
-                    df.at[idx, 'TES_discharged_kWh'] = tes_out
-
-                    # Wind transfer to grid
-                    df.at[idx, 'Grid_transfer_kWh'] = row.get('E_elec_kWh', 0.0)
-
-                    #CAES discharge
-                    m_out = min(caes_discharge_rate, current_storage_kg)
-                    current_storage_kg -= m_out             
-                    total_discharged_kg += m_out
-                    df.at[idx, 'CAES_discharged_kg'] = m_out
-                    
-                else:
-                    # OPERATING MODE 2 (WIND -----> GRID)
-                    df.at[idx, 'Operating_Mode'] = 2
-
-                    df.at[idx, 'Grid_transfer_kWh'] = row.get('E_elec_kWh', 0.0)
-                    total_to_Grid_kWh += row.get('E_elec_kWh', 0.0)
-           
-            elif price < charge_threshold:
-                #available = max_CAES_cap - current_storage_kg
-                available_TES = max_TES_cap - current_TES_storage_kWh
-
-                #m_in = min(row.get('m_air_kg', 0.0), available) if current_storage_kg < max_CAES_cap else 0.0
-                tes_in = min(row.get('E_TES_kWh', 0.0), available_TES) 
-
-                if tes_in > 0:
-                    # Operating Mode (OM 3)   
-                    df.at[idx, 'Operating_Mode'] = 3
-
-                    m_in = row['m_air_kg'] * (tes_in / row['E_TES_kWh'])
-                    current_storage_kg += m_in
-                    current_TES_storage_kWh += tes_in
-                    df.at[idx, 'CAES_charging_kg'] = m_in
-                    df.at[idx, 'TES_charging_kWh'] = tes_in
-
-                    # Part of Electricity generated transfered to the grid directly
-                    df.at[idx, 'Grid_transfer_kWh'] = row['E_elec_kWh'] * (1-(tes_in / row['E_TES_kWh']))
-                    total_to_Grid_kWh += row['E_elec_kWh'] * (1-(tes_in / row['E_TES_kWh']))
-
-                else:
-                    # OPERATING MODE 2 (WIND -----> GRID)    
-                    df.at[idx, 'Operating_Mode'] = 2
-                    df.at[idx, 'Grid_transfer_kWh'] = row.get('E_elec_kWh', 0.0)
-                    total_to_Grid_kWh += row.get('E_elec_kWh', 0.0)                   
-           
-            else:
-                # OPERATING MODE 2 (WIND -----> GRID)    
-                    df.at[idx, 'Operating_Mode'] = 2
-                    df.at[idx, 'Grid_transfer_kWh'] = row.get('E_elec_kWh', 0.0)
-                    total_to_Grid_kWh += row.get('E_elec_kWh', 0.0)
-        else:
-            if price > charge_threshold:
-                if current_storage_kg > 0:
-                    df.at[idx, 'Operating_Mode'] = 4
-                    m_out = min(caes_discharge_rate, current_storage_kg)
-                    current_storage_kg -= m_out             
-                    current_TES_storage_kWh -= tes_out
-                    total_discharged_kg += m_out
-                    total_discharged_kWh += tes_out
-                    total_to_Grid_kWh += 0.0    
-                    df.at[idx, 'CAES_discharged_kg'] = m_out
-                    df.at[idx, 'TES_discharged_kWh'] = tes_out
-                    df.at[idx, 'Grid_transfer_kWh'] = 0.0
-                    
-                else:
-                    df.at[idx, 'Operating_Mode'] = 5
-            else:
-                df.at[idx, 'Operating_Mode'] = 5
-
-        # Update cumulative storage
-        df.at[idx, 'Cumulative_CAES_storage_kg'] = current_storage_kg
-        df.at[idx, 'Cumulative_TES_storage_kWh'] = current_TES_storage_kWh
-        df.at[idx, 'Cumulative_CAES_discharged_kg'] = total_discharged_kg
-        df.at[idx, 'Cumulative_TES_discharged_kWh'] = total_discharged_kWh*eta_t
-        df.at[idx, 'Cumulative_Grid_transfer_kWh'] = total_to_Grid_kWh
-    
+        positive = delta_h_kWh_per_kg > 0
+        caes_discharge_rate = np.where(positive, tes_out / np.where(positive, delta_h_kWh_per_kg, 1.0), 0.0)
+
+        wind = elec_prod > 0
+        sell = price > discharge_th
+
+        # OPERATING MODE 1 (STORAGE AND WIND -----> GRID)
+        mode_1 = wind & sell & ((current_storage_kg > 0) | (current_TES_storage_kWh > 0))
+
+        # OPERATING MODE 3 (WIND -----> STORAGE, rest of the wind -----> GRID)
+        charging = wind & ~sell & (price < charge_th)
+        tes_in = np.minimum(E_TES, max_TES_cap - current_TES_storage_kWh)
+        mode_3 = charging & (tes_in > 0)
+
+        # OPERATING MODE 2 (WIND -----> GRID)
+        mode_2 = wind & ~mode_1 & ~mode_3
+
+        # OPERATING MODE 4 (STORAGE -----> GRID, no wind); otherwise MODE 5 (idle)
+        mode_4 = ~wind & (price > charge_th) & (current_storage_kg > 0)
+        discharging = mode_1 | mode_4
+
+        # OPERATING MODE 6 (GRID -----> STORAGE, no wind, price + tariff below the charge threshold)
+        # limited by the import connection and the free TES capacity; never in
+        # a discharge hour (a negative tariff puts the import threshold above
+        # the charge threshold)
+        room = max_TES_cap - current_TES_storage_kWh
+        grid_in = np.minimum(s['grid_import_limit'], room / tes_per_kWh) if tes_per_kWh > 0 else \
+            np.broadcast_to(s['grid_import_limit'], room.shape)
+        mode_6 = grid_charging_on & ~wind & ~mode_4 & (price < import_cost_th) & (grid_in > 0)
+        grid_in = np.where(mode_6, grid_in, 0.0)
+
+        # TES and CAES discharge
+        m_out = np.where(discharging, np.minimum(caes_discharge_rate, current_storage_kg), 0.0)
+        tes_discharged = np.where(discharging, tes_out, 0.0)
+        tes_exported = tes_discharged * export_factor if x_map is not None else tes_discharged
+
+        # TES and CAES charging, part of the electricity generated transferred to the grid directly
+        fraction = np.where(mode_3, tes_in / np.where(mode_3, E_TES, 1.0), 0.0)
+        m_in = np.where(mode_3, m_air_col[:, t] * fraction, 0.0)
+        tes_in = np.where(mode_3, tes_in, 0.0)
+        if mode_6.any():
+            delta_h = delta_h_col[:, t]
+            eta_in, tes_yield = eta_total, tes_per_kWh
+            if c_map is not None:
+                # compressor efficiency at the import load; Δh of the hour scales with 1 / efficiency
+                eta_c = c_map(grid_in / compressor_capacity, P2 / P1)
+                delta_h = delta_h * eta_c_col[:, t] / eta_c
+                eta_in, tes_yield = eta_c * eta_trans, eta_c * eta_trans * eta_TES
+            m_in = m_in + np.where(mode_6, grid_in * 3600.0 * eta_in / np.where(delta_h > 0, delta_h, 1.0), 0.0)
+            tes_in = tes_in + np.minimum(tes_yield * grid_in, room)
+        # (actual wind in hours decided as windless, with a forecast, also goes to the grid)
+        grid = np.where(mode_1 | mode_2, E_elec, np.where(mode_3, E_elec * (1 - fraction), E_elec))
+
+        if real_gas:
+            # adiabatic expansion of the gas left in the cavern, or adiabatic
+            # mixing of injected air: (m + dm) cv T' = m cv T + dm cp T_inj
+            cavern_T = np.where(
+                m_out > 0,
+                cavern_T * (1 - m_out / m_total) ** (s['gamma'] - 1),
+                np.where(m_in > 0, (m_total * cavern_T + s['gamma'] * m_in * s['T_inj']) / (m_total + m_in), cavern_T)
+            )
+
+        current_storage_kg = current_storage_kg - m_out + m_in
+        current_TES_storage_kWh = current_TES_storage_kWh - tes_discharged + tes_in
+        total_discharged_kg = total_discharged_kg + m_out
+        total_discharged_kWh = total_discharged_kWh + tes_exported
+        total_to_Grid_kWh = total_to_Grid_kWh + grid
+
+        if analytics is not None:
+            analytics.update(current_storage_kg, current_TES_storage_kWh, p_cav)
+
+        if totals is not None:
+            flow_sums += np.array((m_in, m_out, tes_in, tes_exported, grid, grid_in, caes_loss, tes_loss))
+            sales += actual_price * np.array((tes_exported, grid))
+            if grid_charging_on.any():
+                import_cost += (actual_price + s['grid_import_tariff']) * grid_in
+            mode_hours += np.array((mode_1, mode_2, mode_3, mode_4, mode_6))
+            storage = np.array((current_storage_kg, current_TES_storage_kWh))
+            np.minimum(storage_min, storage, out=storage_min)
+            np.maximum(storage_max, storage, out=storage_max)
+            np.maximum(p_max, p_cav, out=p_max)
+            tes_hours += np.array((current_TES_storage_kWh >= max_TES_cap, current_TES_storage_kWh <= 0))
+
+        if out is not None:
+            out['Grid_transfer_kWh'][:, t] = grid
+            out['CAES_charging_kg'][:, t] = m_in
+            out['TES_charging_kWh'][:, t] = tes_in
+            out['Cumulative_CAES_storage_kg'][:, t] = current_storage_kg
+            out['Cumulative_TES_storage_kWh'][:, t] = current_TES_storage_kWh
+            out['CAES_loss_kg'][:, t] = caes_loss
+            out['TES_loss_kWh'][:, t] = tes_loss
+            out['CAES_discharged_kg'][:, t] = m_out
+            out['TES_discharged_kWh'][:, t] = tes_exported
+            out['Cumulative_CAES_discharged_kg'][:, t] = total_discharged_kg
+            out['Cumulative_TES_discharged_kWh'][:, t] = total_discharged_kWh * s['eta_t']
+            out['Cumulative_Grid_transfer_kWh'][:, t] = total_to_Grid_kWh
+            out['Cavern_Pressure_Pa'][:, t] = p_cav
+            out['Cavern_Temperature_K'][:, t] = cavern_T
+            out['Grid_import_kWh'][:, t] = grid_in
+            out['Operating_Mode'][:, t] = 5 - 4 * mode_1 - 3 * mode_2 - 2 * mode_3 - mode_4 + mode_6
+
+    if totals is not None:
+        totals.update(zip(FLOW_TOTALS, flow_sums))
+        totals['Revenue_without_storage'] = np.broadcast_to((price_col * elec_col).sum(axis=1), (n_scenarios,)).copy()
+        totals['Revenue_from_storage'], totals['Revenue_from_grid'] = sales
+        totals['Grid_import_cost'] = import_cost
+        totals['Total_Revenue'] = sales.sum(axis=0) - import_cost
+        totals['mode_hours'] = np.zeros((n_scenarios, 7))
+        totals['mode_hours'][:, [1, 2, 3, 4, 6]] = mode_hours.T
+        totals['mode_hours'][:, 5] = n_hours - mode_hours.sum(axis=0)
+        totals['Min_CAES_storage_kg'], totals['Min_TES_storage_kWh'] = storage_min
+        totals['Max_CAES_storage_kg'], totals['Max_TES_storage_kWh'] = storage_max
+        totals['Max_Cavern_Pressure_Pa'] = p_max
+        totals['Hours_TES_full'], totals['Hours_TES_empty'] = tes_hours
+        totals['hours'] = n_hours
+
+    return {
+        'CAES_storage_kg': current_storage_kg,
+        'TES_storage_kWh': current_TES_storage_kWh,
+        'CAES_discharged_kg': total_discharged_kg,
+        'TES_discharged_kWh': total_discharged_kWh,
+        'Grid_transfer_kWh': total_to_Grid_kWh,
+        'Cavern_Temperature_K': cavern_T,
+    }
+
+
+# Function to allocate and accumulate energy storage with 0.005% hourly loss, charging and discharging
+def allocate_energy_storage(df, charge_threshold=charge_threshold, discharge_threshold=discharge_threshold):
+
+    # Run the array kernel for a single scenario and copy the trajectories into the frame
+    inputs = {col: df[col].to_numpy(dtype=float) if col in df else np.zeros(len(df)) for col in INPUT_COLUMNS}
+    out = {col: np.zeros((1, len(df))) for col in OUTPUT_COLUMNS}
+    dispatch_stage(inputs, out, {'charge_threshold': charge_threshold, 'discharge_threshold': discharge_threshold})
+    for col in OUTPUT_COLUMNS:
+        df[col] = out[col][0]
+
     # Calculate percentage of operation modes over the entire period
     mode_counts = df['Operating_Mode'].value_counts(normalize=True) * 100
     for mode, pct in mode_counts.sort_index().items():
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+forecast_backtest.py
+
+Backtest of the storage dispatch with imperfect foresight.
+
+Usage:
+    python forecast_backtest.py INPUT [--config CONFIG] [--members 200] [--horizon 24] [--lead 12]
+
+The dispatch normally decides every hour on the realized price and wind. Here
+the decisions are taken on synthetic forecast ensembles instead: forecasts
+are issued every --horizon hours for the next --horizon hours, --lead hours
+ahead of the first delivered hour (e.g. day-ahead gate closure). Forecast
+errors follow an AR(1) process over the lead time, so they grow from zero at
+issue towards their stationary spread, and are applied to the price (in
+units of its standard deviation) and to the wind speed (m/s, converted to
+farm power with the turbine power curves). Energy flows follow the actual
+wind and all revenue is settled at the actual price.
+
+All members run as scenarios of one batched summary-only dispatch pass next
+to the perfect-foresight reference, and the report gives the revenue loss
+from imperfect foresight across the ensemble. The config is the JSON of
+acaes.py ("params" only).
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+import pipeline
+import wind_turbine_model
+from acaes import load_config
+
+
+def forecast_errors(rng, n_members, n_hours, horizon, lead, rho):
+    """
+    Standardized AR(1) forecast errors for every member and hour.
+
+    The error of the forecast issued at hour i*horizon - lead for lead time l
+    is e_l = rho e_(l-1) + sqrt(1 - rho^2) w_l with e_0 = 0, so its standard
+    deviation grows as sqrt(1 - rho^(2 l)) towards 1.
+
+    Returns:
+        array of shape (n_members, n_hours)
+    """
+    n_issues = -(-n_hours // horizon)
+    innovations = rng.standard_normal((lead + horizon, n_members, n_issues)) * np.sqrt(1 - rho ** 2)
+    errors = np.empty((horizon, n_members, n_issues))
+    e = np.zeros((n_members, n_issues))
+    for step in range(lead + horizon):
+        e = rho * e + innovations[step]
+        if step >= lead:
+            errors[step - lead] = e
+    # (horizon, members, issues) → (members, issues * horizon) in delivery order
+    return errors.transpose(1, 2, 0).reshape(n_members, -1)[:, :n_hours]
+
+
+def ensemble_forecasts(inputs, n_members=200, horizon=24, lead=12, sigma_price=0.3, sigma_wind=1.5,
+                       rho=0.95, seed=0):
+    """
+    Synthetic price and wind power forecast ensemble around the actuals.
+
+    Parameters:
+        inputs (mapping): preprocessed buffer with 'price' and 'windspeed'
+        n_members (int): ensemble members
+        horizon (int): hours covered by one forecast issue (and issue interval)
+        lead (int): hours between issue and the first delivered hour
+        sigma_price (float): stationary price error, in standard deviations of the price
+        sigma_wind (float): stationary wind speed error (m/s)
+        rho (float): hour-to-hour correlation of the forecast errors
+        seed (int): random seed
+
+    Returns:
+        dict with 'price' and 'Total_Power_Output' arrays of shape (members, hours)
+    """
+    rng = np.random.default_rng(seed)
+    price = np.asarray(inputs['price'], dtype=float)
+    windspeed = np.asarray(inputs['windspeed'], dtype=float)
+    n_hours = len(price)
+
+    price_forecast = price + sigma_price * price.std() * forecast_errors(rng, n_members, n_hours, horizon, lead, rho)
+    windspeed_forecast = np.maximum(
+        windspeed + sigma_wind * forecast_errors(rng, n_members, n_hours, horizon, lead, rho), 0.0)
+    power = wind_turbine_model.power_curves(windspeed_forecast)
+    total_power = wind_turbine_model.limited_power(windspeed_forecast, *power)[3]
+    return {'price': price_forecast, 'Total_Power_Output': total_power}
+
+
+def backtest(inputs, overrides=None, **ensemble):
+    """
+    Runs the perfect-foresight reference and all forecast members.
+
+    Returns:
+        dict with the reference revenue, per-member revenue and the loss statistics.
+    """
+    start = time.perf_counter()
+    forecast = ensemble_forecasts(inputs, **ensemble)
+    forecast_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference, _ = pipeline.run_totals(inputs, [{}], overrides)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    members, _ = pipeline.run_totals(inputs, [{}], overrides, forecast=forecast)
+    ensemble_seconds = time.perf_counter() - start
+
+    perfect = float(reference['Total_Revenue'][0])
+    revenue = members['Total_Revenue']
+    loss = perfect - revenue
+    decided = members['mode_hours'] / reference['hours'] * 100
+    return {
+        'members': int(len(revenue)),
+        'revenue_perfect_foresight': perfect,
+        'revenue_mean': float(revenue.mean()),
+        'revenue_std': float(revenue.std()),
+        'revenue_percentiles': {str(q): float(v) for q, v in zip((5, 50, 95), np.percentile(revenue, (5, 50, 95)))},
+        'loss_mean': float(loss.mean()),
+        'loss_pct_mean': float(loss.mean() / perfect * 100) if perfect else 0.0,
+        'loss_percentiles': {str(q): float(v) for q, v in zip((5, 50, 95), np.percentile(loss, (5, 50, 95)))},
+        'operating_mode_pct_perfect': {str(m): float(h / reference['hours'] * 100)
+                                       for m, h in enumerate(reference['mode_hours'][0]) if h},
+        'operating_mode_pct_mean': {str(m): float(v) for m, v in enumerate(decided.mean(axis=0)) if v},
+        'member_revenue': [float(v) for v in revenue],
+        'seconds': {'forecasts': forecast_seconds, 'reference': reference_seconds, 'ensemble': ensemble_seconds},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Forecast-ensemble backtest of the Wind-CAES dispatch")
+    parser.add_argument('input', help="wind data file (.xlsx, .csv or .parquet)")
+    parser.add_argument('-c', '--config', help="JSON config file (\"params\" overrides)")
+    parser.add_argument('-m', '--members', type=int, default=200, help="ensemble members (default 200)")
+    parser.add_argument('--horizon', type=int, default=24, help="hours per forecast issue (default 24)")
+    parser.add_argument('--lead', type=int, default=12, help="hours from issue to first delivery (default 12)")
+    parser.add_argument('--sigma-price', type=float, default=0.3,
+                        help="price error in standard deviations of the price (default 0.3)")
+    parser.add_argument('--sigma-wind', type=float, default=1.5, help="wind speed error in m/s (default 1.5)")
+    parser.add_argument('--rho', type=float, default=0.95, help="hourly error autocorrelation (default 0.95)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-v', '--verbose', action='store_true', help="print model output to stderr")
+    args = parser.parse_args(argv)
+
+    overrides = load_config(args.config).get('params', {})
+    with pipeline.model_output(args.verbose):
+        inputs = pipeline.load_buffer(args.input, overrides)
+        report = backtest(inputs, overrides, n_members=args.members, horizon=args.horizon, lead=args.lead,
+                          sigma_price=args.sigma_price, sigma_wind=args.sigma_wind, rho=args.rho, seed=args.seed)
+    report = {'input': args.input, 'config': args.config, **report}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
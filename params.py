@@ -37,3 +37,18 @@ TES_cap = 300000 # kWh (maximum TES capacity in kWh)
 # Losses
 CAES_loss = 0 
 TES_loss = 0 
+
+# Real-gas cavern thermodynamics
+real_gas = False # Use the tabulated real-gas properties (Z, h, s) and a variable cavern temperature
+T_inj = 313.15 # K (temperature of the air injected into the cavern after the TES heat exchanger)
+property_table_file = None # Path of the cached property table (.npz); None uses the file next to the code
+
+# Grid charging (operating mode 6)
+grid_charging = False # Charge CAES/TES from grid imports when there is no wind and imports are cheap
+grid_import_limit = 5000 # kW (grid connection limit for imports)
+grid_import_tariff = 0.0 # €/kWh (network tariff paid on top of the price for imported energy)
+
+# Part-load efficiency maps (see efficiency_maps.py for the table format)
+compressor_map = None # Compressor efficiency vs. load fraction and pressure ratio P2/P1 (.csv/.npz path or inline table); None uses eta_comp
+compressor_capacity = 15000 # kW (rated compressor input; load fraction = E_elec_kWh / compressor_capacity)
+expander_map = None # Expander efficiency vs. load fraction (TES discharge / turbine_capacity) and pressure ratio (cavern / P_amb), scales the exported energy by efficiency / eta_t; None uses eta_t
@@ -12,16 +12,17 @@ This script assumes you have a file named "wind and temp.xlsx" in your Downloads
 """
 
 import os
+import sys
+import time
 import itertools
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-import wind_turbine_model
-import Compressor_Model
-import energy_management
-import revenue as revenue_module
+import pipeline
+import revenue
+import result_store
+import plotting
 
 # -----------------------------------------------------------------------------
 # 1) LOCATE YOUR WIND DATA IN DOWNLOADS
@@ -29,6 +30,9 @@ import revenue as revenue_module
 
 WIND_DATA_FILE   = os.path.join("D:/", "wind and temp.xlsx")
 
+# results of earlier runs are reused from here (see result_store.py)
+RESULT_STORE     = "pareto_results.db"
+
 # -----------------------------------------------------------------------------
 # 2) DEFINE YOUR EXPLORATION GRID
 # -----------------------------------------------------------------------------
@@ -41,91 +45,101 @@ STORAGE_CAPS    = [100_000, 200_000, 300_000, 400_000]
 # sell/buy price thresholds to test (in €/kWh)
 PRICE_THRESHOLDS = [0.05, 0.06, 0.07, 0.08, 0.09]
 
-# -----------------------------------------------------------------------------
-# 3) RUN ALL COMBINATIONS
-# -----------------------------------------------------------------------------
-records = []
-
-for tc, sc, pt in itertools.product(TURBINE_CAPS, STORAGE_CAPS, PRICE_THRESHOLDS):
-
-    # --- patch your modules with the current parameters ---
-    # (assumes energy_management.py reads these globals)
-    energy_management.turbine_capacity = tc
-    energy_management.TES_cap         = sc
 
-    # --- a) wind turbine model: load & compute power output ---
-    df = wind_turbine_model.read_wind_data(WIND_DATA_FILE)
-    df = wind_turbine_model.calculate_power_output(df)
-    df = wind_turbine_model.apply_conditions(df)
-
-    # --- b) compressor model ---
-    df = Compressor_Model.compressor_energy_model(df)
-
-    # --- c) storage dispatch (charge/discharge threshold = pt) ---
-    df = energy_management.allocate_energy_storage(
-        df,
-        charge_threshold=pt,
-        discharge_threshold=pt
+def main():
+    # -----------------------------------------------------------------------------
+    # 3) RUN ALL COMBINATIONS
+    # -----------------------------------------------------------------------------
+    combos = list(itertools.product(TURBINE_CAPS, STORAGE_CAPS, PRICE_THRESHOLDS))
+
+    points = [{"turbine_capacity": tc, "TES_cap": sc, "price_threshold": pt} for tc, sc, pt in combos]
+
+    # --- only combinations not in the result store are simulated ---
+    # (every run is recorded in the store with a manifest, as by acaes.py sweep)
+    store = result_store.ResultStore(RESULT_STORE)
+    manifest = {"command": "pareto", "argv": sys.argv[1:], "points": points, "started": time.time(),
+                "code_version": result_store.code_version(), "inputs": {}}
+    start = time.perf_counter()
+    input_id = result_store.input_hash(WIND_DATA_FILE)
+    keys = [result_store.result_key(input_id, point, {"summary": "totals"}) for point in points]
+    found = store.lookup(keys)
+    missing = [i for i, key in enumerate(keys) if key not in found]
+    lookup_seconds = time.perf_counter() - start
+    print(f"{len(points) - len(missing)} of {len(points)} combinations reused from {RESULT_STORE}")
+
+    if missing:
+        # --- a) + b) wind turbine and compressor models: load once into a shared buffer ---
+        inputs = pipeline.load_buffer(WIND_DATA_FILE)
+
+        # --- c) + d) storage dispatch and revenue for the missing combinations in one batched pass ---
+        # (charge/discharge threshold = pt; summary only, no hourly trajectories are kept)
+        t = time.perf_counter()
+        totals, _ = pipeline.run_totals(inputs, [points[i] for i in missing])
+        seconds = (time.perf_counter() - t) / len(missing)
+        for j, i in enumerate(missing):
+            found[keys[i]] = {"summary": {col: float(totals[col][j]) for col in revenue.OUTPUT_COLUMNS}}
+            store.put(keys[i], input_id, points[i], found[keys[i]]["summary"], seconds, commit=False)
+        store.db.commit()
+
+    manifest["inputs"][WIND_DATA_FILE] = {
+        "input_hash": input_id,
+        "points": len(points),
+        "reused": len(points) - len(missing),
+        "computed": len(missing),
+        "failed": 0,
+        "seconds": {"lookup": lookup_seconds, "total": time.perf_counter() - start},
+    }
+    manifest["finished"] = time.time()
+    manifest["run_id"] = store.record_run(manifest)
+    store.close()
+
+    # assemble into DataFrame (total revenue over the full period)
+    results = pd.DataFrame(combos, columns=["turbine_capacity_kW", "TES_capacity_kWh", "price_threshold_€/kWh"])
+    results["total_revenue_€"] = [found[key]["summary"]["Total_Revenue"] for key in keys]
+
+    # -----------------------------------------------------------------------------
+    # 4) FIND PARETO‐EFFICIENT POINTS
+    #    (minimize price_threshold, maximize revenue)
+    # -----------------------------------------------------------------------------
+    pts = results[["price_threshold_€/kWh", "total_revenue_€"]].values
+    is_pareto = np.ones(len(pts), dtype=bool)
+
+    for i, p in enumerate(pts):
+        # any other point that is no worse in both criteria and strictly better in one?
+        mask = (pts[:,0] <= p[0]) & (pts[:,1] >= p[1])
+        mask[i] = False
+        if np.any(mask):
+            is_pareto[i] = False
+
+    pareto_df = results[is_pareto]
+
+    # -----------------------------------------------------------------------------
+    # 5) PLOT Revenue vs. Price Threshold (pareto front in red)
+    #    rendered in a background process while the CSVs are written; large
+    #    sweeps are drawn as a density image instead of one marker per run
+    # -----------------------------------------------------------------------------
+    renderer = plotting.Renderer()
+    figure = renderer.submit(
+        "pareto", "pareto_front.png", dpi=300,
+        x=results["total_revenue_€"].to_numpy(),
+        y=results["price_threshold_€/kWh"].to_numpy(),
+        front_x=pareto_df["total_revenue_€"].to_numpy(),
+        front_y=pareto_df["price_threshold_€/kWh"].to_numpy(),
+        xlabel="Total Revenue (€)",
+        ylabel="Price Threshold (€/kWh)",
+        title="Pareto Front: minimize threshold, maximize revenue",
     )
 
-    # --- d) revenue calculation ---
-    df = revenue_module.calculate_revenue(df)
-
-    # total revenue over the full period
-    total_rev = df["Total_Revenue"].sum()
-
-    records.append({
-        "turbine_capacity_kW": tc,
-        "TES_capacity_kWh":   sc,
-        "price_threshold_€/kWh": pt,
-        "total_revenue_€":    total_rev
-    })
+    # -----------------------------------------------------------------------------
+    # 6) SAVE CSVs
+    # -----------------------------------------------------------------------------
+    results.to_csv("pareto_scan_all.csv", index=False)
+    pareto_df.to_csv("pareto_front.csv", index=False)
 
-# assemble into DataFrame
-results = pd.DataFrame(records)
+    print(f"Plot saved to {figure.result()}")
+    renderer.close()
 
-# -----------------------------------------------------------------------------
-# 4) FIND PARETO‐EFFICIENT POINTS
-#    (minimize price_threshold, maximize revenue)
-# -----------------------------------------------------------------------------
-pts = results[["price_threshold_€/kWh", "total_revenue_€"]].values
-is_pareto = np.ones(len(pts), dtype=bool)
-
-for i, p in enumerate(pts):
-    # any other point that is no worse in both criteria and strictly better in one?
-    mask = (pts[:,0] <= p[0]) & (pts[:,1] >= p[1])
-    mask[i] = False
-    if np.any(mask):
-        is_pareto[i] = False
 
-pareto_df = results[is_pareto]
-
-# -----------------------------------------------------------------------------
-# 5) SAVE CSVs
-# -----------------------------------------------------------------------------
-results.to_csv("pareto_scan_all.csv", index=False)
-pareto_df.to_csv("pareto_front.csv", index=False)
-
-# -----------------------------------------------------------------------------
-# 6) PLOT Revenue vs. Price Threshold (pareto front in red)
-# -----------------------------------------------------------------------------
-plt.figure(figsize=(8,6))
-plt.scatter(
-    results["total_revenue_€"],
-    results["price_threshold_€/kWh"],
-    c="lightgray",
-    label="All runs"
-)
-plt.scatter(
-    pareto_df["total_revenue_€"],
-    pareto_df["price_threshold_€/kWh"],
-    c="red",
-    label="Pareto front"
-)
-plt.xlabel("Total Revenue (€)")
-plt.ylabel("Price Threshold (€/kWh)")
-plt.title("Pareto Front: minimize threshold, maximize revenue")
-plt.legend()
-plt.tight_layout()
-plt.savefig("pareto_front.png", dpi=300)
-plt.show()
+if __name__ == "__main__":
+    # (the background renderer re-imports this module in its process)
+    main()
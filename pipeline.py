@@ -0,0 +1,511 @@
+import os
+import sys
+import json
+import contextlib
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+import params
+import wind_turbine_model
+import Compressor_Model
+import energy_management
+import revenue
+import settlement
+from data_plane import StageBuffer, layout
+
+# Modules that import their parameters from params.py at import time. Overrides
+# are applied by patching these module globals (as pareto_front_analysis.py does).
+PARAM_MODULES = (Compressor_Model, energy_management, revenue)
+
+# Shorthand parameters that set several params.py values at once
+PARAM_ALIASES = {
+    'price_threshold': ('charge_threshold', 'discharge_threshold'),
+}
+
+# Struct-of-arrays layout of the pipeline: per-hour columns shared by all
+# scenarios, and per-scenario (scenarios, hours) columns of dispatch + revenue
+RAW_COLUMNS = ('windspeed', 'temp', 'price')
+PREPROCESSED_COLUMNS = RAW_COLUMNS + wind_turbine_model.OUTPUT_COLUMNS + Compressor_Model.OUTPUT_COLUMNS
+SCENARIO_COLUMNS = energy_management.OUTPUT_COLUMNS + revenue.OUTPUT_COLUMNS
+
+
+def read_input(path):
+    """Reads a wind/temperature/price time series from Excel, CSV or Parquet."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return pd.read_csv(path)
+    if ext in ('.parquet', '.pq'):
+        return pd.read_parquet(path)
+    return wind_turbine_model.read_wind_data(path)
+
+
+def expand_overrides(overrides):
+    """Resolves aliases and checks that every name is a parameter in params.py."""
+    expanded = {}
+    for name, value in (overrides or {}).items():
+        for target in PARAM_ALIASES.get(name, (name,)):
+            if not hasattr(params, target):
+                raise KeyError(f"Unknown parameter: {target}")
+            expanded[target] = value
+    return expanded
+
+
+@contextlib.contextmanager
+def parameters(overrides=None):
+    """Temporarily applies parameter overrides to the pipeline modules."""
+    saved = []
+    try:
+        for name, value in expand_overrides(overrides).items():
+            for module in PARAM_MODULES:
+                if hasattr(module, name):
+                    saved.append((module, name, getattr(module, name)))
+                    setattr(module, name, value)
+        yield
+    finally:
+        for module, name, value in reversed(saved):
+            setattr(module, name, value)
+
+
+def compressor_overrides(overrides):
+    """Subset of the overrides that changes the output of the compressor stage."""
+    return {name: value for name, value in expand_overrides(overrides).items()
+            if hasattr(Compressor_Model, name)}
+
+
+def _log(log, message):
+    if log is not None:
+        log(message)
+
+
+def preprocess(df, overrides=None, log=None, timings=None):
+    """
+    Runs the vectorized stages (wind power, turbine conditions, compressor).
+
+    Parameters:
+        df (DataFrame): raw input with 'windspeed', 'temp' and 'price' columns
+        overrides (dict): parameter overrides (names from params.py)
+        log (callable): optional progress callback taking a message string
+        timings (dict): optional dict that receives the seconds spent per stage
+
+    Returns:
+        DataFrame ready for dispatch.
+    """
+    timings = {} if timings is None else timings
+    with parameters(overrides):
+        start = time.perf_counter()
+        df = wind_turbine_model.calculate_power_output(df)
+        timings['wind_power'] = time.perf_counter() - start
+        _log(log, "Calculated wind power output.")
+
+        start = time.perf_counter()
+        df = wind_turbine_model.apply_conditions(df)
+        timings['conditions'] = time.perf_counter() - start
+        _log(log, "Applied turbine operating conditions.")
+
+        start = time.perf_counter()
+        df = Compressor_Model.compressor_energy_model(df)
+        timings['compressor'] = time.perf_counter() - start
+        _log(log, "Computed compressor energy model.")
+    return df
+
+
+def dispatch(df, overrides=None, log=None, timings=None):
+    """Runs the stateful storage dispatch and the revenue calculation on a preprocessed frame."""
+    timings = {} if timings is None else timings
+    with parameters(overrides):
+        start = time.perf_counter()
+        df = energy_management.allocate_energy_storage(
+            df,
+            charge_threshold=energy_management.charge_threshold,
+            discharge_threshold=energy_management.discharge_threshold
+        )
+        timings['dispatch'] = time.perf_counter() - start
+        _log(log, "Allocated energy storage.")
+
+        start = time.perf_counter()
+        df = revenue.calculate_revenue(df, import_tariff=energy_management.grid_import_tariff)
+        timings['revenue'] = time.perf_counter() - start
+        _log(log, "Calculated revenue.")
+    return df
+
+
+def run_pipeline(source, overrides=None, log=None, timings=None):
+    """
+    Runs the full pipeline: read → wind power → conditions → compressor → dispatch → revenue.
+
+    Parameters:
+        source (str or DataFrame): input file path or an already loaded frame
+        overrides (dict): parameter overrides (names from params.py)
+        log (callable): optional progress callback taking a message string
+        timings (dict): optional dict that receives the seconds spent per stage
+
+    Returns:
+        DataFrame with all stage columns.
+    """
+    timings = {} if timings is None else timings
+    if isinstance(source, pd.DataFrame):
+        df = source
+    else:
+        start = time.perf_counter()
+        df = read_input(source)
+        timings['read'] = time.perf_counter() - start
+    _log(log, f"Data loaded: {len(df)} rows")
+
+    df = preprocess(df, overrides, log, timings)
+    return dispatch(df, overrides, log, timings)
+
+
+@contextlib.contextmanager
+def model_output(verbose=False):
+    """Routes the print() output of the model modules to stderr (verbose) or discards it."""
+    if verbose:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    else:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+
+# Preprocessed frames per (input file, compressor overrides), kept so that
+# repeated runs on the same input share them. Both this cache and the buffer
+# cache below are least-recently-used and hold at most PREPROCESSED_CACHE_SIZE
+# entries each, so a long-lived process (simulation_service workers) that sees
+# many distinct compressor overrides does not keep every full series.
+PREPROCESSED_CACHE_SIZE = 8
+_preprocessed = OrderedDict()
+
+
+def _cached(cache, key, build):
+    """Returns cache[key], building it on a miss and evicting the least recently used entry."""
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = cache[key] = build()
+    while len(cache) > PREPROCESSED_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def preprocessed_frame(path, overrides=None):
+    """
+    Returns the preprocessed frame of an input file, computing it on first use.
+    The cached frame must not be modified; pass a copy to dispatch().
+    """
+    path = os.path.abspath(path)
+    key = (path, os.path.getmtime(path), json.dumps(compressor_overrides(overrides), sort_keys=True))
+    return _cached(_preprocessed, key, lambda: preprocess(read_input(path), overrides))
+
+
+def capacity_factor(total_power_kWh, n_hours):
+    """Capacity factor of the wind farm [%] from its total output over n_hours."""
+    return float(total_power_kWh / (wind_turbine_model.TOTAL_CAP_WIND_TURBINE * n_hours) * 100) if n_hours else 0.0
+
+
+def summary_record(totals, k, n_hours, capacity_factor_pct, mode_hours):
+    """
+    Machine-readable summary of scenario k: the schema shared by summarize(),
+    summarize_buffer(), summary_records() and archive_pipeline.
+
+    Parameters:
+        totals (mapping): revenue.OUTPUT_COLUMNS and 'Grid_import_kWh' totals, one per scenario
+        k (int): scenario index
+        n_hours (int): hours of the run
+        capacity_factor_pct (float): wind farm capacity factor (see capacity_factor)
+        mode_hours (array): hours per operating mode (index = mode)
+    """
+    summary = {
+        'hours': int(n_hours),
+        'capacity_factor_pct': capacity_factor_pct,
+        'revenue_without_storage': float(totals['Revenue_without_storage'][k]),
+        'revenue_from_storage': float(totals['Revenue_from_storage'][k]),
+        'revenue_from_grid': float(totals['Revenue_from_grid'][k]),
+        'grid_import_kWh': float(totals['Grid_import_kWh'][k]),
+        'grid_import_cost': float(totals['Grid_import_cost'][k]),
+        'total_revenue': float(totals['Total_Revenue'][k]),
+    }
+    summary['saving_from_storage'] = summary['total_revenue'] - summary['revenue_without_storage']
+    summary['operating_mode_pct'] = {str(mode): float(hours / n_hours * 100)
+                                     for mode, hours in enumerate(mode_hours) if hours}
+    return summary
+
+
+def summarize(df):
+    """Machine-readable totals of a pipeline result."""
+    totals = {col: [df[col].sum()] for col in revenue.OUTPUT_COLUMNS}
+    totals['Grid_import_kWh'] = [df['Grid_import_kWh'].sum() if 'Grid_import_kWh' in df else 0.0]
+    return summary_record(totals, 0, len(df), capacity_factor(df['Total_Power_Output'].sum(), len(df)),
+                          np.bincount(df['Operating_Mode'].to_numpy(dtype=int)))
+
+
+# ---------------------------------------------------------------------------
+# Struct-of-arrays path: stages read and write StageBuffer views in place
+# ---------------------------------------------------------------------------
+
+def preprocess_buffer(buf, overrides=None):
+    """Runs the wind and compressor stages in place on a buffer of PREPROCESSED_COLUMNS."""
+    with parameters(overrides):
+        wind_turbine_model.wind_power_stage(buf)
+        Compressor_Model.compressor_stage(buf)
+    return buf
+
+
+def load_buffer(source, overrides=None, backing='heap', path=None):
+    """
+    Reads an input (path or DataFrame) into a new StageBuffer and runs the
+    wind and compressor stages on it. Optional market price and schedule
+    columns of the input (settlement.MARKET_COLUMNS, SCHEDULE_COLUMNS) are
+    kept in the buffer as well.
+
+    Parameters:
+        source (str or DataFrame): input file path or an already loaded frame
+        overrides (dict): parameter overrides (names from params.py)
+        backing (str): 'heap', 'shm' or 'memmap' (see data_plane.StageBuffer)
+        path (str): file for the 'memmap' backing
+    """
+    df = source if isinstance(source, pd.DataFrame) else read_input(source)
+    columns = PREPROCESSED_COLUMNS + tuple(c for c in settlement.MARKET_COLUMNS + settlement.SCHEDULE_COLUMNS
+                                           if c in df)
+    buf = StageBuffer(layout(columns, len(df)), backing, path)
+    buf.load_frame(df)
+    return preprocess_buffer(buf, overrides)
+
+
+# Preprocessed buffers per (input file, compressor overrides), cached like the
+# frames of preprocessed_frame().
+_preprocessed_buffers = OrderedDict()
+
+
+def preprocessed_buffer(path, overrides=None):
+    """Returns the resident preprocessed buffer of an input file, computing it on first use."""
+    path = os.path.abspath(path)
+    key = (path, os.path.getmtime(path), json.dumps(compressor_overrides(overrides), sort_keys=True))
+    return _cached(_preprocessed_buffers, key, lambda: load_buffer(path, overrides))
+
+
+def split_overrides(overrides):
+    """
+    Splits overrides into (per-scenario, fixed): names the dispatch kernel
+    accepts per scenario (energy_management.BATCH_PARAMS) and all others,
+    which must be the same for every scenario of a batched run.
+    """
+    batch, fixed = {}, {}
+    for name, value in expand_overrides(overrides).items():
+        (batch if name in energy_management.BATCH_PARAMS else fixed)[name] = value
+    return batch, fixed
+
+
+def group_points(points):
+    """
+    Groups sweep points that can share one batched run.
+
+    Returns:
+        list of (fixed overrides, indices into points, per-scenario overrides).
+    """
+    groups = {}
+    for i, point in enumerate(points):
+        batch, fixed = split_overrides(point)
+        key = json.dumps(fixed, sort_keys=True)
+        entry = groups.setdefault(key, (fixed, [], []))
+        entry[1].append(i)
+        entry[2].append(batch)
+    return list(groups.values())
+
+
+def batch_settings(points, names=None):
+    """
+    Per-scenario arrays of BATCH_PARAMS for a batched run: the value of every
+    point, or else the current module value (call it inside parameters()).
+
+    Parameters:
+        points (list): one dict of per-scenario overrides per scenario
+        names (iterable): parameters to resolve (default: those set by any point)
+    """
+    expanded = [split_overrides(point)[0] for point in points]
+    names = set().union(*expanded) if names is None else names
+    return {name: np.array([point.get(name, getattr(energy_management, name)) for point in expanded], dtype=float)
+            for name in names}
+
+
+def run_scenarios(inputs, points, overrides=None, out=None, state=None, analytics=None):
+    """
+    Runs dispatch and revenue for many scenarios in one batched pass.
+
+    Parameters:
+        inputs (StageBuffer): preprocessed buffer (see load_buffer)
+        points (list): one dict of per-scenario overrides (BATCH_PARAMS names) per scenario
+        overrides (dict): overrides that apply to all scenarios
+        out (StageBuffer): optional preallocated buffer of SCENARIO_COLUMNS
+        state (dict): optional storage state to start from
+        analytics (DispatchAnalytics): optional cycle/pressure-swing counters filled during dispatch
+
+    Returns:
+        (out, final storage state)
+    """
+    n_hours = len(inputs['price'])
+    if out is None:
+        out = StageBuffer(layout(SCENARIO_COLUMNS, n_hours, len(points)))
+    with parameters(overrides):
+        settings = batch_settings(points)
+        state = energy_management.dispatch_stage(inputs, out, settings, state, analytics)
+        tariff = energy_management.dispatch_settings(settings)['grid_import_tariff']
+        revenue.revenue_stage(inputs, out, out, tariff)
+    return out, state
+
+
+def summarize_buffer(inputs, out, analytics=None):
+    """
+    Machine-readable totals per scenario (same keys as summarize()), plus
+    a 'cycles' record per scenario when the run had DispatchAnalytics.
+    """
+    n_hours = len(inputs['price'])
+    cf = capacity_factor(inputs['Total_Power_Output'].sum(), n_hours)
+    totals = {col: out[col].sum(axis=1) for col in revenue.OUTPUT_COLUMNS + ('Grid_import_kWh',)}
+    modes = out['Operating_Mode']
+    summaries = [summary_record(totals, k, n_hours, cf, np.bincount(modes[k].astype(int)))
+                 for k in range(modes.shape[0])]
+    if analytics is not None:
+        for summary, cycles in zip(summaries, analytics.results()):
+            summary['cycles'] = cycles
+    return summaries
+
+
+def run_totals(inputs, points, overrides=None, state=None, analytics=None, forecast=None):
+    """
+    Summary-only version of run_scenarios: the dispatch kernel accumulates
+    per-scenario totals during its single pass and no trajectories are stored.
+    forecast is passed to the kernel (decisions on forecasts, see
+    energy_management.dispatch_stage).
+
+    Returns:
+        (totals dict of energy_management.dispatch_stage, final storage state)
+    """
+    totals = {}
+    with parameters(overrides):
+        state = energy_management.dispatch_stage(inputs, None, batch_settings(points), state, analytics, totals,
+                                                 forecast)
+    return totals, state
+
+
+def run_summaries(inputs, points, overrides=None, state=None, analytics=None, forecast=None):
+    """
+    Runs run_totals and returns (list of summary dicts (see summary_records),
+    final storage state).
+    """
+    totals, state = run_totals(inputs, points, overrides, state, analytics, forecast)
+    return summary_records(inputs, totals, analytics), state
+
+
+def summary_records(inputs, totals, analytics=None):
+    """
+    Per-scenario summaries from the totals of a summary-mode dispatch, with
+    the keys of summarize_buffer() plus energy throughput and storage ranges.
+    """
+    n_hours = totals['hours']
+    cf = capacity_factor(inputs['Total_Power_Output'].sum(), n_hours)
+    summaries = []
+    for k in range(len(totals['Total_Revenue'])):
+        summary = summary_record(totals, k, n_hours, cf, totals['mode_hours'][k])
+        summary['throughput'] = {name: float(totals[name][k]) for name in energy_management.FLOW_TOTALS}
+        summary['storage'] = {name: float(totals[name][k]) for name in (
+            'Min_CAES_storage_kg', 'Max_CAES_storage_kg', 'Min_TES_storage_kWh', 'Max_TES_storage_kWh',
+            'Max_Cavern_Pressure_Pa', 'Hours_TES_full', 'Hours_TES_empty')}
+        summaries.append(summary)
+    if analytics is not None:
+        for summary, cycles in zip(summaries, analytics.results()):
+            summary['cycles'] = cycles
+    return summaries
+
+
+def result_frame(inputs, out, scenario=0):
+    """Full result table of one scenario, laid out like the DataFrame pipeline output."""
+    df = pd.concat([inputs.to_frame(), out.to_frame(scenario)], axis=1)
+    mode_counts = df['Operating_Mode'].value_counts(normalize=True) * 100
+    for mode, pct in mode_counts.sort_index().items():
+        df[f'Operating_Mode_{int(mode)}_Pct'] = pct
+    return df
+
+
+
+# ---------------------------------------------------------------------------
+# Interactive what-if session
+# ---------------------------------------------------------------------------
+
+def downstream_stages(names):
+    """
+    Stages that must re-run after the given parameters changed: compressor
+    parameters → compressor + dispatch, dispatch parameters → dispatch only
+    (revenue always runs with the dispatch; the wind stage has no parameters).
+    """
+    stages = set()
+    for name in expand_overrides({name: None for name in names}):
+        if hasattr(Compressor_Model, name):
+            stages.update(('compressor', 'dispatch'))
+        if hasattr(energy_management, name):
+            stages.add('dispatch')
+    return stages
+
+
+class Session:
+    """
+    Keeps one input resident as a preprocessed StageBuffer and re-runs only
+    the stages downstream of the parameters that change.
+
+    Parameters:
+        source (str or DataFrame): input file path or an already loaded frame
+        overrides (dict): initial parameter overrides (names from params.py)
+    """
+
+    def __init__(self, source, overrides=None):
+        df = source if isinstance(source, pd.DataFrame) else read_input(source)
+        self.overrides = expand_overrides(overrides)
+        self.inputs = StageBuffer(layout(PREPROCESSED_COLUMNS, len(df))).load_frame(df)
+        self.out = StageBuffer(layout(SCENARIO_COLUMNS, len(df), 1))
+        self.timings = {}
+        wind_turbine_model.wind_power_stage(self.inputs)
+        self._run({'compressor', 'dispatch'})
+
+    def value(self, name):
+        """Current value of a parameter in this session."""
+        if name in self.overrides:
+            return self.overrides[name]
+        for module in PARAM_MODULES:
+            if hasattr(module, name):
+                return getattr(module, name)
+        return getattr(params, name)
+
+    def update(self, overrides):
+        """
+        Applies parameter changes and re-runs the affected stages.
+
+        Returns:
+            set of the stages that were re-run (empty if nothing changed).
+        """
+        changed = {name: value for name, value in expand_overrides(overrides).items()
+                   if value != self.value(name)}
+        self.overrides.update(changed)
+        stages = downstream_stages(changed)
+        self._run(stages)
+        return stages
+
+    def _run(self, stages):
+        self.timings = {}
+        if 'compressor' in stages:
+            start = time.perf_counter()
+            with parameters(self.overrides):
+                Compressor_Model.compressor_stage(self.inputs)
+            self.timings['compressor'] = time.perf_counter() - start
+        if 'dispatch' in stages:
+            start = time.perf_counter()
+            batch, fixed = split_overrides(self.overrides)
+            run_scenarios(self.inputs, [batch], fixed, self.out)
+            self.timings['dispatch'] = time.perf_counter() - start
+
+    def summary(self):
+        """Totals of the current result (see summarize_buffer)."""
+        return summarize_buffer(self.inputs, self.out)[0]
+
+    def frame(self):
+        """Full result table of the current parameters (see result_frame)."""
+        return result_frame(self.inputs, self.out)
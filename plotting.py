@@ -0,0 +1,209 @@
+"""
+plotting.py
+
+Plotting for large results: time series are decimated to the pixel width of
+the figure (min/max per pixel bucket, or LTTB), scatters of more points than
+can be told apart are drawn as a density image, and figures are rendered to
+files in a background process with the non-interactive Agg backend, so that
+neither a script nor the Tk loop of EnergyApp waits on matplotlib.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Time series shown by EnergyApp's plot window (those present in the results)
+SERIES_COLUMNS = ('price', 'Total_Power_Output', 'Cumulative_CAES_storage_kg', 'Cumulative_TES_storage_kWh',
+                  'Cavern_Pressure_Pa', 'Operating_Mode')
+
+# Above this many points a scatter is drawn as a 2-D histogram
+SCATTER_MAX_POINTS = 20_000
+
+
+def minmax_decimate(x, y, n_buckets):
+    """
+    Keeps the first, last, minimum and maximum point of each of n_buckets
+    equal buckets: every peak survives, so a line plot at n_buckets pixels
+    looks the same as the full series.
+
+    Returns:
+        (x, y) with at most 2 * n_buckets + 2 points, in the original order.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.asarray(x), y
+    size = -(-n // n_buckets)
+    rows = -(-n // size)
+    # Pad the last bucket with its last value, then arg-reduce every row at once
+    padded = np.empty(rows * size)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    padded = padded.reshape(rows, size)
+    offsets = np.arange(rows) * size
+    keep = np.concatenate(([0, n - 1], offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1)))
+    keep = np.unique(np.minimum(keep, n - 1))
+    return np.asarray(x)[keep], y[keep]
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: from every bucket the point
+    spanning the largest triangle with the previously kept point and the
+    mean of the next bucket. Keeps the visual shape with n_out points.
+
+    Returns:
+        (x, y) with n_out points.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+    xf = np.arange(n, dtype=float) if not np.issubdtype(x.dtype, np.number) else x.astype(float)
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    cum_x = np.concatenate(([0.0], np.cumsum(xf)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], edges[i + 2]
+            cx = (cum_x[nhi] - cum_x[nlo]) / (nhi - nlo)
+            cy = (cum_y[nhi] - cum_y[nlo]) / (nhi - nlo)
+        else:
+            cx, cy = xf[-1], y[-1]
+        area = np.abs((xf[a] - cx) * (y[lo:hi] - y[a]) - (xf[a] - xf[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def decimate(x, y, n_pixels, method='minmax'):
+    """Decimates a series for a plot n_pixels wide ('minmax', 'lttb' or 'none')."""
+    if method == 'minmax':
+        return minmax_decimate(x, y, n_pixels)
+    if method == 'lttb':
+        return lttb(x, y, 2 * n_pixels)
+    if method == 'none':
+        return np.asarray(x), np.asarray(y)
+    raise ValueError(f"Unknown decimation method: {method}")
+
+
+def scatter(ax, x, y, max_points=SCATTER_MAX_POINTS, bins=200, label=None, **kwargs):
+    """
+    Scatter plot that switches to a log-scaled 2-D histogram (density image)
+    above max_points points.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return ax.scatter(x, y, label=label, **kwargs)
+    from matplotlib.colors import LogNorm
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    counts = np.ma.masked_equal(counts.T, 0)
+    mesh = ax.pcolormesh(x_edges, y_edges, counts, norm=LogNorm(), cmap='Greys')
+    ax.figure.colorbar(mesh, ax=ax, label=f"runs per bin ({len(x):,} runs)")
+    return mesh
+
+
+def pareto_figure(x, y, front_x, front_y, xlabel='', ylabel='', title='', figsize=(8, 6)):
+    """Figure of all runs (gray, as density when large) with the Pareto front in red."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    scatter(ax, x, y, c='lightgray', label='All runs')
+    order = np.argsort(front_x)
+    ax.scatter(np.asarray(front_x)[order], np.asarray(front_y)[order], c='red', label='Pareto front')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+
+def series_figure(index, series, method='minmax', figsize=(12, 8), dpi=100, title=''):
+    """
+    One panel per series on a shared x axis, each decimated to the pixel
+    width of the figure.
+
+    Parameters:
+        index (array): x values (hour number or timestamps)
+        series (dict): name → array, all as long as index
+        method (str): 'minmax', 'lttb' or 'none'
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, dpi=dpi)
+    axes = np.atleast_1d(fig.subplots(len(series), 1, sharex=True, squeeze=False)[:, 0])
+    n_pixels = int(figsize[0] * dpi)
+    for ax, (name, values) in zip(axes, series.items()):
+        ax.plot(*decimate(index, values, n_pixels, method), linewidth=0.8)
+        ax.set_title(name, loc='left', fontsize=8)
+        ax.grid(True, alpha=0.3)
+    if title:
+        fig.suptitle(title)
+    fig.tight_layout()
+    return fig
+
+
+FIGURES = {'pareto': pareto_figure, 'series': series_figure}
+
+
+def render(kind, path, dpi=100, **data):
+    """Builds a figure of one of FIGURES and writes it to path; returns path."""
+    fig = FIGURES[kind](**data)
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+class Renderer:
+    """
+    Renders figures in a background process (Agg backend). submit() returns
+    a concurrent.futures.Future with the written path.
+    """
+
+    def __init__(self):
+        self.pool = None
+
+    def submit(self, kind, path, dpi=100, **data):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=1, initializer=_init_worker)
+        return self.pool.submit(render, kind, path, dpi, **data)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def when_done(widget, future, callback, interval=100):
+    """
+    Calls callback(future) from the Tk loop of widget once future is done,
+    polling with widget.after so the GUI never blocks on the renderer.
+    """
+    if future.done():
+        callback(future)
+    else:
+        widget.after(interval, when_done, widget, future, callback, interval)
+
+
+def series_data(frame, columns=SERIES_COLUMNS):
+    """Index and series of a result frame for series_figure (the columns present)."""
+    series = {name: frame[name].to_numpy(dtype=float) for name in columns if name in frame}
+    return {'index': np.arange(len(frame)), 'series': series}
@@ -0,0 +1,255 @@
+import os
+import tempfile
+import zipfile
+import numpy as np
+from params import R_specific
+
+# Real-gas properties of air on a precomputed (pressure x temperature) grid.
+#
+# The table holds the compressibility factor Z, specific enthalpy h [kJ/kg]
+# and specific entropy s [kJ/(kg·K)]. It is built once (Peng-Robinson equation
+# of state, or CoolProp when it is installed), cached on disk as .npz and then
+# shared by Compressor_Model and energy_management so that every timestep only
+# costs a bilinear table lookup.
+
+# Peng-Robinson constants for dry air treated as a pseudo-pure fluid
+T_crit = 132.53 # K
+P_crit = 3.786e6 # Pa
+omega = 0.0335 # acentric factor
+
+# Ideal-gas heat capacity of air, cp0 = a + b*T + c*T^2 + d*T^3 [kJ/(kg·K)]
+CP0_COEFFS = (1.05, -0.365e-3, 0.85e-6, -0.39e-9)
+
+# Reference state (h = 0, s = 0 for the ideal gas)
+T_ref = 298.15 # K
+P_ref = 101325.0 # Pa
+
+# Grid: log-spaced in pressure, uniform in temperature
+P_MIN, P_MAX, N_P = 5.0e4, 2.0e7, 241 # Pa
+T_MIN, T_MAX, N_T = 200.0, 1000.0, 161 # K
+
+TABLE_VERSION = 1
+DEFAULT_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'air_property_table.npz')
+
+
+def _ideal_gas_h_s(T, P):
+    """Ideal-gas enthalpy [kJ/kg] and entropy [kJ/(kg·K)] relative to (T_ref, P_ref)."""
+    a, b, c, d = CP0_COEFFS
+    h = (a * (T - T_ref) + b / 2 * (T**2 - T_ref**2)
+         + c / 3 * (T**3 - T_ref**3) + d / 4 * (T**4 - T_ref**4))
+    s = (a * np.log(T / T_ref) + b * (T - T_ref)
+         + c / 2 * (T**2 - T_ref**2) + d / 3 * (T**3 - T_ref**3)
+         - R_specific / 1000.0 * np.log(P / P_ref))
+    return h, s
+
+
+def peng_robinson_properties(P, T):
+    """
+    Computes Z, h and s of air with the Peng-Robinson equation of state.
+
+    Parameters:
+        P (array): pressure [Pa]
+        T (array): temperature [K]
+
+    Returns:
+        tuple (Z, h [kJ/kg], s [kJ/(kg·K)]) broadcast to the shape of P and T.
+    """
+    P, T = np.broadcast_arrays(np.asarray(P, dtype=float), np.asarray(T, dtype=float))
+    R = R_specific
+    kappa = 0.37464 + 1.54226 * omega - 0.26992 * omega**2
+    a_c = 0.45724 * R**2 * T_crit**2 / P_crit
+    b = 0.07780 * R * T_crit / P_crit
+    sqrt_alpha = 1 + kappa * (1 - np.sqrt(T / T_crit))
+    a = a_c * sqrt_alpha**2
+    da_dT = -a_c * kappa * sqrt_alpha / np.sqrt(T * T_crit)
+
+    A = a * P / (R * T)**2
+    B = b * P / (R * T)
+
+    # Largest root of Z^3 - (1-B) Z^2 + (A - 3B^2 - 2B) Z - (AB - B^2 - B^3) = 0,
+    # found by Newton iteration from the ideal-gas value (air is supercritical here)
+    c2 = -(1 - B)
+    c1 = A - 3 * B**2 - 2 * B
+    c0 = -(A * B - B**2 - B**3)
+    Z = np.ones_like(P)
+    for _ in range(50):
+        f = ((Z + c2) * Z + c1) * Z + c0
+        df = (3 * Z + 2 * c2) * Z + c1
+        step = f / df
+        Z = Z - step
+        if np.all(np.abs(step) < 1e-12):
+            break
+
+    log_term = np.log((Z + (1 + np.sqrt(2)) * B) / (Z + (1 - np.sqrt(2)) * B))
+    h_dep = R * T * (Z - 1) + (T * da_dT - a) / (2 * np.sqrt(2) * b) * log_term
+    s_dep = R * np.log(Z - B) + da_dT / (2 * np.sqrt(2) * b) * log_term
+
+    h_ig, s_ig = _ideal_gas_h_s(T, P)
+    return Z, h_ig + h_dep / 1000.0, s_ig + s_dep / 1000.0
+
+
+def coolprop_properties(P, T):
+    """Computes Z, h and s of air with CoolProp (same units and shapes as peng_robinson_properties)."""
+    from CoolProp.CoolProp import PropsSI
+
+    P, T = np.broadcast_arrays(np.asarray(P, dtype=float), np.asarray(T, dtype=float))
+    Z = PropsSI('Z', 'P', P.ravel(), 'T', T.ravel(), 'Air').reshape(P.shape)
+    h = PropsSI('H', 'P', P.ravel(), 'T', T.ravel(), 'Air').reshape(P.shape) / 1000.0
+    s = PropsSI('S', 'P', P.ravel(), 'T', T.ravel(), 'Air').reshape(P.shape) / 1000.0
+    return Z, h, s
+
+
+class PropertyTable:
+    """
+    Bilinear interpolation of Z, h and s on a (log pressure x temperature) grid.
+
+    All lookups accept scalars or NumPy arrays and broadcast like ufuncs.
+    Values outside the grid are extrapolated linearly from the edge cells.
+    """
+
+    def __init__(self, log_p, T, Z, h, s, backend):
+        self.log_p = log_p
+        self.T = T
+        self.Z_grid = Z
+        self.h_grid = h
+        self.s_grid = s
+        self.backend = backend
+        self.log_p0 = log_p[0]
+        self.inv_dlogp = (len(log_p) - 1) / (log_p[-1] - log_p[0])
+        self.T0 = T[0]
+        self.inv_dT = (len(T) - 1) / (T[-1] - T[0])
+        self._isobars = {}
+
+    def _cell(self, P, T):
+        x = (np.log(P) - self.log_p0) * self.inv_dlogp
+        y = (np.asarray(T, dtype=float) - self.T0) * self.inv_dT
+        i = np.clip(np.floor(x).astype(int), 0, len(self.log_p) - 2)
+        j = np.clip(np.floor(y).astype(int), 0, len(self.T) - 2)
+        return i, j, x - i, y - j
+
+    def _interp(self, grid, P, T):
+        i, j, fx, fy = self._cell(P, T)
+        return ((1 - fx) * ((1 - fy) * grid[i, j] + fy * grid[i, j + 1])
+                + fx * ((1 - fy) * grid[i + 1, j] + fy * grid[i + 1, j + 1]))
+
+    def Z(self, P, T):
+        return self._interp(self.Z_grid, P, T)
+
+    def h(self, P, T):
+        return self._interp(self.h_grid, P, T)
+
+    def s(self, P, T):
+        return self._interp(self.s_grid, P, T)
+
+    def isobar(self, P):
+        """Returns (T, h, s) along a fixed pressure, cached per pressure value."""
+        key = float(P)
+        row = self._isobars.get(key)
+        if row is None:
+            row = (self.T, self.h(key, self.T), self.s(key, self.T))
+            self._isobars[key] = row
+        return row
+
+    def T_from_s(self, P, s):
+        T_row, _, s_row = self.isobar(P)
+        return np.interp(s, s_row, T_row)
+
+    def T_from_h(self, P, h):
+        T_row, h_row, _ = self.isobar(P)
+        return np.interp(h, h_row, T_row)
+
+    def h_from_s(self, P, s):
+        _, h_row, s_row = self.isobar(P)
+        return np.interp(s, s_row, h_row)
+
+    def pressure(self, m, T, V, iterations=3):
+        """
+        Cavern pressure [Pa] of m kg of air at temperature T [K] in volume V [m³],
+        solving p = Z(p, T) * m * R * T / V by fixed-point iteration.
+        """
+        p_ideal = np.asarray(m, dtype=float) * R_specific * T / V
+        p = np.maximum(p_ideal, P_MIN)
+        for _ in range(iterations):
+            p = np.maximum(p_ideal * self.Z(p, T), P_MIN)
+        return np.where(p_ideal > 0, p, 0.0)
+
+    def isentropic_enthalpy_drop(self, P_in, T_in, P_out):
+        """Isentropic enthalpy drop [kJ/kg] expanding from (P_in, T_in) to the fixed pressure P_out."""
+        return self.h(P_in, T_in) - self.h_from_s(P_out, self.s(P_in, T_in))
+
+
+def build_property_table(backend=None):
+    """
+    Evaluates the equation of state on the full grid.
+
+    Parameters:
+        backend (str): 'coolprop' or 'peng-robinson'. Defaults to CoolProp when
+                       it is importable and Peng-Robinson otherwise.
+    """
+    if backend is None:
+        try:
+            import CoolProp  # noqa: F401
+            backend = 'coolprop'
+        except ImportError:
+            backend = 'peng-robinson'
+
+    log_p = np.linspace(np.log(P_MIN), np.log(P_MAX), N_P)
+    T = np.linspace(T_MIN, T_MAX, N_T)
+    P_grid, T_grid = np.meshgrid(np.exp(log_p), T, indexing='ij')
+    if backend == 'coolprop':
+        Z, h, s = coolprop_properties(P_grid, T_grid)
+    else:
+        Z, h, s = peng_robinson_properties(P_grid, T_grid)
+    return PropertyTable(log_p, T, Z, h, s, backend)
+
+
+def _grid_meta():
+    return np.array([TABLE_VERSION, P_MIN, P_MAX, N_P, T_MIN, T_MAX, N_T, R_specific], dtype=float)
+
+
+def save_property_table(table, path):
+    # Unique temporary file in the target directory, so that concurrent
+    # writers (sweep workers with a cold cache) never interleave
+    fd, tmp = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, meta=_grid_meta(), backend=np.array(table.backend),
+                     log_p=table.log_p, T=table.T, Z=table.Z_grid, h=table.h_grid, s=table.s_grid)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_property_table(path):
+    """Loads a cached table, or returns None if it is missing or was built for another grid."""
+    try:
+        with np.load(path) as data:
+            if not np.array_equal(data['meta'], _grid_meta()):
+                return None
+            return PropertyTable(data['log_p'], data['T'], data['Z'], data['h'], data['s'],
+                                 str(data['backend']))
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+
+
+_tables = {}
+
+
+def get_property_table(path=None, rebuild=False):
+    """
+    Returns the shared property table, loading it from the disk cache or
+    building (and caching) it on first use.
+    """
+    path = path or DEFAULT_TABLE_FILE
+    if not rebuild and path in _tables:
+        return _tables[path]
+    table = None if rebuild else load_property_table(path)
+    if table is None:
+        table = build_property_table()
+        try:
+            save_property_table(table, path)
+        except OSError:
+            pass  # read-only location: keep the table in memory only
+    _tables[path] = table
+    return table
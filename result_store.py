@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+import numpy as np
+
+import params
+import pipeline
+import settlement
+
+# Modules whose source defines the model and the stored summaries; their hash
+# is the code version
+CODE_MODULES = ('params', 'wind_turbine_model', 'Compressor_Model', 'energy_management', 'revenue',
+                'real_gas_properties', 'efficiency_maps', 'pipeline', 'data_plane', 'cycle_counting',
+                'settlement', 'acaes')
+
+# Parameters that name a data file; the key holds the hash of its contents
+FILE_PARAMS = ('compressor_map', 'expander_map', 'property_table_file')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    input_hash TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    params TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    blob TEXT,
+    seconds REAL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    finished REAL,
+    manifest TEXT NOT NULL
+);
+"""
+
+_input_hashes = {}
+_code_version = None
+
+
+def input_hash(source):
+    """
+    SHA-256 of an input: the file contents for a path (cached per path,
+    size and modification time), or the bytes of the columns of a
+    DataFrame/buffer that the pipeline reads (raw, market and schedule columns).
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        path = os.path.abspath(source)
+        stat = os.stat(path)
+        ident = (path, stat.st_size, stat.st_mtime_ns)
+        if ident not in _input_hashes:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            _input_hashes[ident] = digest.hexdigest()
+        return _input_hashes[ident]
+    for name in pipeline.RAW_COLUMNS + settlement.MARKET_COLUMNS + settlement.SCHEDULE_COLUMNS:
+        if name not in source:
+            continue
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(source[name], dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def code_version():
+    """SHA-256 of the source of the model modules (CODE_MODULES)."""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        base = os.path.dirname(os.path.abspath(__file__))
+        for name in CODE_MODULES:
+            with open(os.path.join(base, name + '.py'), 'rb') as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def effective_params(overrides=None):
+    """All params.py values with the (alias-expanded) overrides applied."""
+    values = {name: value for name, value in vars(params).items()
+              if not name.startswith('_') and isinstance(value, (bool, int, float, str, type(None), list, dict))}
+    values.update(pipeline.expand_overrides(overrides))
+    return values
+
+
+def result_key(input_id, overrides=None, options=None):
+    """
+    Key of one run: hash of the input hash, the effective parameters, the
+    code version and any options that change the stored result (e.g. which
+    analytics the summary includes). Parameters that name a file
+    (FILE_PARAMS) are keyed by the file contents, not by the path.
+    """
+    values = effective_params(overrides)
+    for name in FILE_PARAMS:
+        if isinstance(values.get(name), str) and os.path.isfile(values[name]):
+            values[name] = {'path': values[name], 'sha256': input_hash(values[name])}
+    payload = {'input': input_id, 'params': values, 'code': code_version(), 'options': options or {}}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def save_blob(path, frame):
+    """Writes a result frame as a compressed columnar .npz (atomically); text columns are kept as strings."""
+    from pandas.api.types import is_numeric_dtype
+    columns = {str(name): frame[name].to_numpy() if is_numeric_dtype(frame[name].dtype)
+               else frame[name].astype(str).to_numpy().astype(str) for name in frame.columns}
+    tmp = path + '.tmp.npz'
+    np.savez_compressed(tmp, **columns)
+    os.replace(tmp, path)
+
+
+def load_blob(path):
+    """Reads a blob written by save_blob as a DataFrame."""
+    import pandas as pd
+    with np.load(path) as data:
+        return pd.DataFrame({name: data[name] for name in data.files})
+
+
+class ResultStore:
+    """
+    Local result store: summaries in SQLite, full result tables as columnar
+    .npz blobs next to the database, keyed by result_key().
+
+    Parameters:
+        path (str): SQLite database file; blobs go to '<path>.blobs/'
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.blob_dir = path + '.blobs'
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def blob_path(self, key):
+        return os.path.join(self.blob_dir, key + '.npz')
+
+    _COLUMNS = "key, summary, blob, seconds, created, params"
+
+    @staticmethod
+    def _record(row):
+        blob = row[2] if row[2] and os.path.exists(row[2]) else None
+        return {'key': row[0], 'summary': json.loads(row[1]), 'blob': blob, 'seconds': row[3],
+                'created': row[4], 'params': json.loads(row[5])}
+
+    def get(self, key):
+        """Stored record of a key (dict with 'summary', 'blob', 'seconds', ...) or None."""
+        row = self.db.execute(f"SELECT {self._COLUMNS} FROM results WHERE key = ?", (key,)).fetchone()
+        return None if row is None else self._record(row)
+
+    def lookup(self, keys):
+        """Maps each stored key of keys to its record (one query per 500 keys)."""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT {self._COLUMNS} FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for row in rows:
+                found[row[0]] = self._record(row)
+        return found
+
+    def put(self, key, input_id, overrides, summary, seconds=None, blob=None, commit=True):
+        """Stores (or replaces) the result of one run (commit=False batches several puts)."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO results (key, input_hash, code_version, params, summary, blob, seconds, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, input_id, code_version(), json.dumps(effective_params(overrides), sort_keys=True),
+             json.dumps(summary), blob, seconds, time.time()))
+        if commit:
+            self.db.commit()
+
+    def record_run(self, manifest):
+        """Adds a run manifest to the runs table; returns its run_id."""
+        cur = self.db.execute("INSERT INTO runs (started, finished, manifest) VALUES (?, ?, ?)",
+                              (manifest.get('started', time.time()), manifest.get('finished'),
+                               json.dumps(manifest)))
+        self.db.commit()
+        return cur.lastrowid
+
+    def stats(self):
+        results = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        runs = self.db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        return {'path': self.path, 'results': results, 'runs': runs}
@@ -1,45 +1,87 @@
 import pandas as pd
+import numpy as np
+from params import grid_import_tariff
 
 def calculate_revenue(
                       df, 
                       grid_price_col='price', 
                       tes_discharge_col='TES_discharged_kWh',
                       export_col='Grid_transfer_kWh', 
-                      power_output_wind_turbine='Total_Power_Output'
+                      power_output_wind_turbine='Total_Power_Output',
+                      import_col='Grid_import_kWh',
+                      import_tariff=None
                       ):
     """
     Calculates total revenue from:
     1. Selling thermal energy discharged from TES (converted to electricity)
     2. Selling electricity sent directly to the grid from wind
+    minus the cost of grid imports for charging (operating mode 6), if any
 
     Parameters:
         df (DataFrame): Must include 'price', 'TES_discharged_kWh', and 'Grid_transfer_kWh' columns
         grid_price_col (str): Name of the column representing market price
         tes_discharge_col (str): Name of the column for TES discharge (in kWh)
         export_col (str): Name of the column for energy sent directly to grid from wind (in kWh)
+        import_col (str): Name of the column for energy imported from the grid (in kWh)
+        import_tariff (float): Network tariff paid per imported kWh on top of the price
+                               (default: grid_import_tariff of params.py, as used by the dispatch)
 
     Returns:
         DataFrame with new columns:
             - 'Revenue_from_storage' (price * TES_discharged_kWh)
             - 'Revenue_from_grid' (price * Grid_transfer_kWh)
+            - 'Grid_import_cost' ((price + import_tariff) * Grid_import_kWh)
             - 'Total_Revenue'
     """
-    
+    if import_tariff is None:
+        import_tariff = grid_import_tariff
+
     df['Revenue_without_storage'] = df[grid_price_col] * df[power_output_wind_turbine]
     df['Revenue_from_storage'] = df[grid_price_col] * df[tes_discharge_col]
     df['Revenue_from_grid'] = df[grid_price_col] * df[export_col]
-    df['Total_Revenue'] = df['Revenue_from_storage'] + df['Revenue_from_grid']
+    df['Grid_import_cost'] = (df[grid_price_col] + import_tariff) * df[import_col] if import_col in df else 0.0
+    df['Total_Revenue'] = df['Revenue_from_storage'] + df['Revenue_from_grid'] - df['Grid_import_cost']
     
     total_without_storage = df['Revenue_without_storage'].sum()
     total_from_storage   = df['Revenue_from_storage'].sum()
     total_from_grid      = df['Revenue_from_grid'].sum()
+    total_import_cost    = df['Grid_import_cost'].sum()
     total_revenue        = df['Total_Revenue'].sum()
     annual_saving        = total_revenue-total_without_storage
     
     print(f"Total revenue without storage: €{total_without_storage:>15,.2f}")
     print(f"Total revenue from storage:    €{total_from_storage:>15,.2f}")
     print(f"Total revenue from grid:       €{total_from_grid:>15,.2f}")
+    if total_import_cost:
+        print(f"Grid import cost:              €{total_import_cost:>15,.2f}")
     print(f"Grand total revenue:           €{total_revenue:>15,.2f}")
     print(f"Annual saving from storage:    €{annual_saving:>15,.2f}")
 
-    return df
\ No newline at end of file
+    return df
+
+
+# Columns written by revenue_stage, one row per scenario
+OUTPUT_COLUMNS = ('Revenue_without_storage', 'Revenue_from_storage', 'Revenue_from_grid', 'Grid_import_cost', 'Total_Revenue')
+
+def revenue_stage(inputs, dispatch, out, import_tariff=None):
+    """
+    Array version of calculate_revenue for a batch of dispatch scenarios.
+
+    Parameters:
+        inputs (mapping): 'price' and 'Total_Power_Output' arrays of shape (hours,)
+        dispatch (mapping): 'TES_discharged_kWh', 'Grid_transfer_kWh' and 'Grid_import_kWh'
+                            arrays of shape (scenarios, hours)
+        out (mapping): OUTPUT_COLUMNS arrays of shape (scenarios, hours), written in place
+        import_tariff (float or array): network tariff per imported kWh, one value per scenario
+                                        (default: grid_import_tariff of params.py)
+    """
+    if import_tariff is None:
+        import_tariff = grid_import_tariff
+    price = inputs['price']
+    np.multiply(price, inputs['Total_Power_Output'], out=out['Revenue_without_storage'])
+    np.multiply(price, dispatch['TES_discharged_kWh'], out=out['Revenue_from_storage'])
+    np.multiply(price, dispatch['Grid_transfer_kWh'], out=out['Revenue_from_grid'])
+    np.multiply(np.add(np.reshape(import_tariff, (-1, 1)), price), dispatch['Grid_import_kWh'], out=out['Grid_import_cost'])
+    np.add(out['Revenue_from_storage'], out['Revenue_from_grid'], out=out['Total_Revenue'])
+    np.subtract(out['Total_Revenue'], out['Grid_import_cost'], out=out['Total_Revenue'])
+    return out
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+segment_scan.py
+
+Multi-year storage strategy scan with parallel annual (or monthly) segments.
+
+Usage:
+    python segment_scan.py INPUT [--config CONFIG] [--period year] [--start 2003-01-01T00]
+                                 [--levels 5] [--passes 10] [--tolerance 1e-9] [--jobs N] [--validate]
+
+The storage state carries over from hour to hour, so a 20-year run is one
+long sequential pass. Here the horizon is split into calendar segments
+(--period year or month, counted from --start) that run in parallel:
+
+1. Grid pass: every segment is simulated from a grid of candidate initial
+   states (--levels x --levels fractions of the CAES mass at P_max_s and of
+   TES_cap), all candidates and sweep points of a segment as scenarios of
+   one batched summary-only dispatch.
+2. Stitch: from the actual (empty) start, the end state and totals of each
+   segment are interpolated bilinearly from its candidate grid at the start
+   state handed over by the previous segment.
+3. Fix-up: every segment is re-run in parallel from its stitched start. The
+   difference between the end state of a segment and the start used by the
+   next one is the boundary mismatch. Further passes restart every segment
+   from the end state of the previous segment in the last pass, until the
+   largest mismatch (as a fraction of the CAES and TES capacity) is at most
+   --tolerance or --passes passes have run. After pass n the first n
+   segments are exact, so with as many passes as segments the scan equals
+   the serial run; in practice the storage trajectories from different
+   starts merge within a few passes and the mismatch drops to zero.
+
+The reported totals are those of the last fix-up pass. The revenue error
+bound carries the remaining mismatch through the chain of segments: the
+start error of segment k + 1 is at most the mismatch at the boundary plus
+the start error of segment k times the sensitivity of the end state to the
+start state, and every segment adds its start error times the sensitivity of
+its revenue. Both sensitivities are Lipschitz constants estimated from the
+candidate grid (largest finite difference between neighbouring candidates),
+and the bound adds the floating-point rounding of the revenue sums. With a
+zero mismatch the bound is the rounding term alone. --validate also runs
+the full serial simulation and reports the actual error. The config is the
+JSON of acaes.py ("params" and "sweep").
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+import pipeline
+import settlement
+import energy_management
+from data_plane import StageBuffer
+from acaes import load_config, sweep_points, run_tasks
+
+# Totals of the segments that are summed over the horizon
+SUMMED_TOTALS = energy_management.FLOW_TOTALS + energy_management.REVENUE_TOTALS + ('mode_hours',)
+
+
+def segments(n_hours, start='2023-01-01T00', period='year'):
+    """(first hour, end hour) of every calendar segment of the series."""
+    labels, starts = settlement.periods(n_hours, start, period)
+    ends = np.r_[starts[1:], n_hours]
+    return [(str(label), int(a), int(b)) for label, a, b in zip(labels, starts, ends)]
+
+
+def capacities(points, overrides=None):
+    """
+    Per-point scale of the candidate states: CAES mass at P_max_s (ideal
+    gas at T_s) and TES_cap.
+    """
+    with pipeline.parameters(overrides):
+        s = pipeline.batch_settings(points, ('P_max_s', 'V_pore_s', 'R_specific', 'T_s', 'TES_cap'))
+    return s['P_max_s'] * s['V_pore_s'] / (s['R_specific'] * s['T_s']), s['TES_cap']
+
+
+def bilinear(values, u, v):
+    """
+    Interpolates values of shape (points, levels, levels) on the unit grid
+    of start fractions at one (u, v) per point (clamped to the grid).
+    """
+    n = values.shape[-1] - 1
+    x = np.clip(u, 0.0, 1.0) * n
+    y = np.clip(v, 0.0, 1.0) * n
+    i = np.minimum(x.astype(int), n - 1)
+    j = np.minimum(y.astype(int), n - 1)
+    fx, fy = x - i, y - j
+    p = np.arange(len(values))
+    return ((1 - fx) * ((1 - fy) * values[p, i, j] + fy * values[p, i, j + 1])
+            + fx * ((1 - fy) * values[p, i + 1, j] + fy * values[p, i + 1, j + 1]))
+
+
+def run_segment(task):
+    """
+    Runs hours [first, end) of the shared input buffer from the given
+    storage states; returns the summed totals and the end state.
+    """
+    inputs = task['buffer'] if isinstance(task['buffer'], StageBuffer) else StageBuffer.attach(task['buffer'])
+    try:
+        first, end = task['hours']
+        columns = {name: inputs[name][first:end] for name in energy_management.INPUT_COLUMNS}
+        with pipeline.model_output(task['verbose']):
+            totals, state = pipeline.run_totals(columns, task['points'], task['overrides'], task['state'])
+    finally:
+        if inputs is not task['buffer']:
+            inputs.close()
+    return {name: totals[name] for name in SUMMED_TOTALS}, state
+
+
+def lipschitz(values, axis):
+    """
+    Largest slope per point of values (points, levels, levels) on the unit
+    grid of start fractions along axis 1 (CAES) or 2 (TES).
+    """
+    n = values.shape[-1] - 1
+    return np.abs(np.diff(values, axis=axis)).max(axis=(1, 2)) * n
+
+
+def error_bound(surfaces, mismatch):
+    """
+    Bound on the revenue error of the chained segments (see the module
+    docstring).
+
+    Parameters:
+        surfaces (list): per segment 'caes', 'tes' and 'revenue' on the grid of start fractions
+        mismatch (list): per boundary (CAES, TES) mismatch as fractions of capacity, one value per point
+
+    Returns:
+        array with one bound (€) per point.
+    """
+    error_u = error_v = bound = 0.0
+    for k, surface in enumerate(surfaces):
+        if k:
+            # start error of segment k: mismatch at its boundary plus the
+            # propagated start error of segment k - 1
+            previous = surfaces[k - 1]
+            du, dv = np.abs(mismatch[k - 1][0]), np.abs(mismatch[k - 1][1])
+            error_u, error_v = (du + lipschitz(previous['caes'], 1) * error_u + lipschitz(previous['caes'], 2) * error_v,
+                                dv + lipschitz(previous['tes'], 1) * error_u + lipschitz(previous['tes'], 2) * error_v)
+        bound = bound + lipschitz(surface['revenue'], 1) * error_u + lipschitz(surface['revenue'], 2) * error_v
+    return bound
+
+
+def _state(n_scenarios, caes_kg, tes_kWh, cavern_T=None):
+    state = energy_management.initial_state(n_scenarios)
+    state['CAES_storage_kg'] = np.asarray(caes_kg, dtype=float)
+    state['TES_storage_kWh'] = np.asarray(tes_kWh, dtype=float)
+    if cavern_T is not None:
+        state['Cavern_Temperature_K'] = np.asarray(cavern_T, dtype=float)
+    return state
+
+
+def segment_scan(inputs, points=None, overrides=None, start='2023-01-01T00', period='year', levels=5,
+                 passes=10, tolerance=1e-9, jobs=1, verbose=False):
+    """
+    Parallel segmented run of a long series (see the module docstring).
+
+    Parameters:
+        inputs (StageBuffer): preprocessed buffer (see pipeline.load_buffer);
+                              with jobs > 1 use backing='shm' so workers attach to it
+        points (list): per-scenario overrides (BATCH_PARAMS names), default one scenario
+        overrides (dict): overrides that apply to all scenarios
+        start (str): timestamp of the first hour; period: 'year' or 'month'
+        levels (int): candidate start fractions per storage (levels x levels states)
+        passes (int): maximum number of fix-up passes
+        tolerance (float): largest accepted boundary mismatch, as a fraction of capacity
+        jobs (int): worker processes
+
+    Returns:
+        dict with per-point 'totals' (summed over the segments of the last
+        pass), 'stitched_revenue', 'mismatch' and 'revenue_error_bound',
+        plus 'segments', 'passes' (run), 'converged' (mismatch within
+        tolerance) and 'seconds' per phase.
+    """
+    points = points or [{}]
+    n_points = len(points)
+    spans = segments(len(inputs['price']), start, period)
+    buffer = inputs if jobs == 1 else inputs.spec()
+    caes_cap, tes_cap = capacities(points, overrides)
+    seconds = {}
+
+    def tasks(scenario_points, states):
+        return [{'buffer': buffer, 'hours': (a, b), 'points': scenario_points, 'overrides': overrides or {},
+                 'state': state, 'verbose': verbose} for (_, a, b), state in zip(spans, states)]
+
+    # 1. Grid pass: candidates (u, v) of every point as scenarios p * levels^2 + i * levels + j
+    t = time.perf_counter()
+    fractions = np.linspace(0.0, 1.0, levels)
+    u, v = (g.ravel() for g in np.meshgrid(fractions, fractions, indexing='ij'))
+    grid_points = [point for point in points for _ in range(len(u))]
+    grid_state = _state(len(grid_points), np.outer(caes_cap, u).ravel(), np.outer(tes_cap, v).ravel())
+    grid = run_tasks(tasks(grid_points, [grid_state] * len(spans)), jobs, run_segment)
+    shape = (n_points, levels, levels)
+    surfaces = [{'caes': (end['CAES_storage_kg'] / np.repeat(caes_cap, len(u))).reshape(shape),
+                 'tes': (end['TES_storage_kWh'] / np.repeat(tes_cap, len(u))).reshape(shape),
+                 'revenue': totals['Total_Revenue'].reshape(shape)}
+                for totals, end in grid]
+    seconds['grid'] = time.perf_counter() - t
+
+    # 2. Stitch: hand the interpolated end state of each segment to the next
+    t = time.perf_counter()
+    starts = [(np.zeros(n_points), np.zeros(n_points))]
+    stitched_revenue = np.zeros(n_points)
+    for surface in surfaces:
+        su, sv = starts[-1]
+        stitched_revenue += bilinear(surface['revenue'], su, sv)
+        starts.append((bilinear(surface['caes'], su, sv), bilinear(surface['tes'], su, sv)))
+    starts = starts[:-1]
+    seconds['stitch'] = time.perf_counter() - t
+
+    # 3. Fix-up passes from the stitched (then previous-pass) start states,
+    # until the boundary mismatch is within tolerance (the real-gas cavern
+    # temperature restarts at T_s in the grid and first fix-up pass, later
+    # passes take it from the previous segment)
+    t = time.perf_counter()
+    cavern_T = [None] * len(spans)
+    for n in range(max(passes, 1)):
+        states = [_state(n_points, su * caes_cap, sv * tes_cap, T) for (su, sv), T in zip(starts, cavern_T)]
+        runs = run_tasks(tasks(points, states), jobs, run_segment)
+        # Boundary mismatch: end state of segment k vs. the start of segment k + 1 (fractions)
+        mismatch = [(end['CAES_storage_kg'] / caes_cap - su, end['TES_storage_kWh'] / tes_cap - sv)
+                    for (_, end), (su, sv) in zip(runs[:-1], starts[1:])]
+        converged = all(np.abs(m).max() <= tolerance for m in mismatch)
+        if converged or n == passes - 1:
+            break
+        starts = starts[:1] + [(end['CAES_storage_kg'] / caes_cap, end['TES_storage_kWh'] / tes_cap)
+                               for _, end in runs[:-1]]
+        cavern_T = [None] + [end['Cavern_Temperature_K'] for _, end in runs[:-1]]
+    seconds['fixup'] = time.perf_counter() - t
+
+    totals = {name: sum(run[0][name] for run in runs) for name in SUMMED_TOTALS}
+    # Rounding of the hourly revenue sums (serial and segmented)
+    rounding = 2 * np.finfo(float).eps * len(inputs['price']) * (
+        totals['Revenue_from_storage'] + totals['Revenue_from_grid'] + totals['Grid_import_cost'])
+
+    return {
+        'segments': [label for label, _, _ in spans],
+        'totals': totals,
+        'stitched_revenue': stitched_revenue,
+        'mismatch': {'max_CAES_kg': np.abs([m[0] for m in mismatch]).max(axis=0, initial=0.0) * caes_cap,
+                     'max_TES_kWh': np.abs([m[1] for m in mismatch]).max(axis=0, initial=0.0) * tes_cap},
+        'revenue_error_bound': error_bound(surfaces, mismatch) + np.abs(rounding),
+        'passes': n + 1,
+        'converged': converged,
+        'seconds': seconds,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segmented parallel multi-year Wind-CAES scan")
+    parser.add_argument('input', help="wind data file (.xlsx, .csv or .parquet)")
+    parser.add_argument('-c', '--config', help="JSON config file (params and sweep, as for acaes.py)")
+    parser.add_argument('--period', choices=('year', 'month'), default='year', help="segment length (default year)")
+    parser.add_argument('--start', default='2023-01-01T00', help="timestamp of the first hour (ISO format)")
+    parser.add_argument('--levels', type=int, default=5, help="candidate start fractions per storage (default 5)")
+    parser.add_argument('--passes', type=int, default=10, help="maximum fix-up passes (default 10)")
+    parser.add_argument('--tolerance', type=float, default=1e-9,
+                        help="boundary mismatch to stop at, as a fraction of capacity (default 1e-9)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--validate', action='store_true', help="also run the full serial simulation")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print model output to stderr")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    results = []
+    start = time.perf_counter()
+    for fixed, indices, batch in pipeline.group_points(sweep_points(config)):
+        with pipeline.model_output(args.verbose):
+            inputs = pipeline.load_buffer(args.input, fixed, backing='heap' if args.jobs == 1 else 'shm')
+        with inputs:
+            scan = segment_scan(inputs, batch, fixed, args.start, args.period, args.levels, args.passes,
+                                args.tolerance, args.jobs, args.verbose)
+            if args.validate:
+                t = time.perf_counter()
+                with pipeline.model_output(args.verbose):
+                    serial, _ = pipeline.run_totals(inputs, batch, fixed)
+                serial_seconds = time.perf_counter() - t
+        for k, point in enumerate(batch):
+            record = {
+                'params': dict(fixed, **point),
+                'segments': len(scan['segments']),
+                'total_revenue': float(scan['totals']['Total_Revenue'][k]),
+                'stitched_revenue': float(scan['stitched_revenue'][k]),
+                'revenue_error_bound': float(scan['revenue_error_bound'][k]),
+                'passes': scan['passes'],
+                'converged': scan['converged'],
+                'max_mismatch_CAES_kg': float(scan['mismatch']['max_CAES_kg'][k]),
+                'max_mismatch_TES_kWh': float(scan['mismatch']['max_TES_kWh'][k]),
+                'seconds': scan['seconds'],
+            }
+            if args.validate:
+                record['serial_revenue'] = float(serial['Total_Revenue'][k])
+                record['revenue_error'] = record['total_revenue'] - record['serial_revenue']
+                record['serial_seconds'] = serial_seconds
+            results.append(record)
+
+    report = {'input': args.input, 'config': args.config, 'period': args.period, 'levels': args.levels,
+              'max_passes': args.passes, 'tolerance': args.tolerance, 'jobs': args.jobs, 'seconds': time.perf_counter() - start, 'results': results}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
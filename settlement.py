@@ -0,0 +1,210 @@
+import numpy as np
+
+# Optional price columns of an input file, next to the day-ahead 'price' (€/kWh)
+MARKET_COLUMNS = ('price_intraday', 'price_imbalance', 'price_import')
+
+# Optional schedule columns of an input file (kWh per hour): the day-ahead
+# schedule of the plant and its net intraday sales (negative: bought back)
+SCHEDULE_COLUMNS = ('schedule_kWh', 'intraday_kWh')
+
+# Sources of the day-ahead schedule (see day_ahead_schedule)
+SCHEDULE_SOURCES = ('input', 'persistence', 'actual')
+
+# Revenue streams of the settlement cube (€, costs are negative)
+STREAMS = ('day_ahead', 'intraday', 'imbalance', 'grid_import', 'network_tariff', 'total')
+
+# Operating modes of energy_management.dispatch_stage (index 0 unused)
+N_MODES = 7
+
+# numpy datetime64 unit per settlement period
+PERIOD_UNITS = {'hour': 'h', 'day': 'D', 'month': 'M', 'year': 'Y'}
+
+
+def hours(n_hours, start='2023-01-01T00'):
+    """Hourly datetime64 timestamps of a series starting at start."""
+    return np.datetime64(start, 'h') + np.arange(n_hours)
+
+
+def periods(n_hours, start='2023-01-01T00', period='month'):
+    """
+    Splits an hourly series into contiguous calendar periods.
+
+    Parameters:
+        n_hours (int): length of the series
+        start (str): timestamp of the first hour (ISO format)
+        period (str): 'hour', 'day', 'month', 'year' or 'all'
+
+    Returns:
+        (labels, starts): period labels (strings) and the index of the first
+        hour of every period, as used by np.add.reduceat.
+    """
+    if period == 'all':
+        return np.array(['all']), np.array([0])
+    if period not in PERIOD_UNITS:
+        raise ValueError(f"Unknown settlement period: {period}")
+    stamps = hours(n_hours, start).astype(f'datetime64[{PERIOD_UNITS[period]}]')
+    starts = np.flatnonzero(np.r_[True, stamps[1:] != stamps[:-1]])
+    return stamps[starts].astype(str), starts
+
+
+def tou_tariff(n_hours, start='2023-01-01T00', peak=0.0, offpeak=0.0, peak_hours=(7, 22), weekdays_only=True):
+    """
+    Time-of-use network tariff (€/kWh) for every hour of the series.
+
+    Parameters:
+        peak, offpeak (float): tariff inside and outside the peak window
+        peak_hours (tuple): first hour of the peak window and the hour it ends
+        weekdays_only (bool): weekends are off-peak all day
+    """
+    stamps = hours(n_hours, start)
+    hour_of_day = (stamps - stamps.astype('datetime64[D]')).astype(int)
+    is_peak = (hour_of_day >= peak_hours[0]) & (hour_of_day < peak_hours[1])
+    if weekdays_only:
+        # 1970-01-01 was a Thursday: day 0 → weekday 3 (Monday = 0)
+        weekday = (stamps.astype('datetime64[D]').astype(int) + 3) % 7
+        is_peak &= weekday < 5
+    return np.where(is_peak, peak, offpeak)
+
+
+def market_prices(inputs):
+    """Price arrays of the input (a StageBuffer or mapping); missing markets fall back to day-ahead."""
+    day_ahead = np.asarray(inputs['price'], dtype=float)
+    prices = {'day_ahead': day_ahead}
+    for name in MARKET_COLUMNS:
+        prices[name[len('price_'):]] = np.asarray(inputs[name], dtype=float) if name in inputs else day_ahead
+    return prices
+
+
+def day_ahead_schedule(inputs, dispatch, source='input'):
+    """
+    Day-ahead schedule and intraday sales for settle().
+
+    Parameters:
+        inputs (mapping): input arrays, with the optional SCHEDULE_COLUMNS
+        dispatch (mapping): dispatch output arrays of shape (scenarios, hours)
+        source (str): 'input' - the schedule_kWh and intraday_kWh columns
+                      of the input, where present; 'persistence' - the
+                      export of the same hour on the previous day (a naive
+                      day-ahead forecast; the first day is scheduled at its
+                      actual export); 'actual' - no schedule, the export is
+                      settled day-ahead and nothing at the imbalance price
+
+    Returns:
+        (schedule, intraday): arrays, or None for the defaults of settle().
+    """
+    if source not in SCHEDULE_SOURCES:
+        raise ValueError(f"Unknown schedule source: {source}")
+    if source == 'input':
+        return tuple(np.asarray(inputs[name], dtype=float) if name in inputs else None
+                     for name in SCHEDULE_COLUMNS)
+    if source == 'persistence':
+        export = np.add(dispatch['Grid_transfer_kWh'], dispatch['TES_discharged_kWh'])
+        schedule = export.copy()
+        schedule[:, 24:] = export[:, :-24]
+        return schedule, None
+    return None, None
+
+
+def settle(inputs, dispatch, start='2023-01-01T00', period='month', prices=None, tariff=None,
+           schedule=None, intraday=None, by_mode=False):
+    """
+    Multi-market settlement of a batch of dispatch scenarios, reduced to a
+    revenue cube in one pass per stream (np.add.reduceat over the contiguous
+    periods, np.bincount over operating modes) without per-row DataFrames.
+
+    Exported energy (Grid_transfer_kWh + TES_discharged_kWh) is sold on the
+    day-ahead market as scheduled, adjusted on the intraday market, and the
+    remaining deviation (actual - schedule - intraday) is settled at the
+    imbalance price. Grid imports (Grid_import_kWh, if the dispatch has it)
+    pay the import price plus the network tariff.
+
+    Parameters:
+        inputs (mapping): 'price' (and optional MARKET_COLUMNS) arrays of shape (hours,)
+        dispatch (mapping): dispatch output arrays of shape (scenarios, hours)
+        start (str): timestamp of the first hour (ISO format)
+        period (str): 'hour', 'day', 'month', 'year' or 'all'
+        prices (dict): price arrays by market ('day_ahead', 'intraday',
+                       'imbalance', 'import'), (hours,) or (scenarios, hours);
+                       the default is market_prices(inputs)
+        tariff (array or float): network tariff on imports (€/kWh), (hours,) or
+                                 (scenarios, hours), e.g. from tou_tariff()
+        schedule (array): day-ahead schedule in kWh, (hours,) or (scenarios,
+                          hours); the default is the actual export (see
+                          day_ahead_schedule for other sources)
+        intraday (array): energy sold intraday in kWh (negative: bought back); default none
+        by_mode (bool): also reduce the streams per operating mode
+
+    Returns:
+        dict with 'streams', 'periods' (labels), 'cube' of shape
+        (scenarios, periods, streams) and, with by_mode, 'mode_cube' of
+        shape (scenarios, modes, streams).
+    """
+    market = market_prices(inputs)
+    market.update(prices or {})
+
+    export = np.add(dispatch['Grid_transfer_kWh'], dispatch['TES_discharged_kWh'])
+    n_scenarios, n_hours = export.shape
+    schedule = export if schedule is None else np.broadcast_to(schedule, export.shape)
+    grid_import = dispatch['Grid_import_kWh'] if 'Grid_import_kWh' in dispatch else None
+    labels, starts = periods(n_hours, start, period)
+
+    cube = np.zeros((n_scenarios, len(labels), len(STREAMS)))
+    mode_cube = np.zeros((n_scenarios, N_MODES, len(STREAMS))) if by_mode else None
+    if by_mode:
+        modes = np.asarray(dispatch['Operating_Mode']).astype(int)
+        mode_index = (np.arange(n_scenarios)[:, None] * N_MODES + modes).ravel()
+
+    work = np.empty((n_scenarios, n_hours))
+
+    def reduce(k):
+        cube[:, :, k] = np.add.reduceat(work, starts, axis=1)
+        if by_mode:
+            mode_cube[:, :, k] = np.bincount(mode_index, weights=work.ravel(),
+                                             minlength=n_scenarios * N_MODES).reshape(n_scenarios, N_MODES)
+
+    np.multiply(market['day_ahead'], schedule, out=work)
+    reduce(0)
+
+    deviation = export - schedule
+    if intraday is not None:
+        np.multiply(market['intraday'], intraday, out=work)
+        reduce(1)
+        deviation = deviation - intraday
+
+    np.multiply(market['imbalance'], deviation, out=work)
+    reduce(2)
+
+    if grid_import is not None:
+        np.multiply(market['import'], grid_import, out=work)
+        np.negative(work, out=work)
+        reduce(3)
+        if tariff is not None:
+            np.multiply(tariff, grid_import, out=work)
+            np.negative(work, out=work)
+            reduce(4)
+
+    cube[:, :, -1] = cube[:, :, :-1].sum(axis=2)
+    if by_mode:
+        mode_cube[:, :, -1] = mode_cube[:, :, :-1].sum(axis=2)
+
+    result = {'streams': STREAMS, 'periods': labels, 'cube': cube}
+    if by_mode:
+        result['mode_cube'] = mode_cube
+    return result
+
+
+def settlement_records(result):
+    """Per-scenario JSON-serializable records: stream totals and per-period totals."""
+    records = []
+    for k in range(result['cube'].shape[0]):
+        cube = result['cube'][k]
+        record = {
+            'totals': {stream: float(v) for stream, v in zip(result['streams'], cube.sum(axis=0))},
+            'periods': {str(label): {stream: float(v) for stream, v in zip(result['streams'], row)}
+                        for label, row in zip(result['periods'], cube)},
+        }
+        if 'mode_cube' in result:
+            record['modes'] = {str(mode): {stream: float(v) for stream, v in zip(result['streams'], row)}
+                               for mode, row in enumerate(result['mode_cube'][k]) if row.any()}
+        records.append(record)
+    return records
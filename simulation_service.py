@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+simulation_service.py
+
+Local HTTP service that runs storage dispatch + revenue on demand.
+
+Usage:
+    python simulation_service.py --port 8765 --workers 4 --preload "wind and temp.xlsx"
+
+Endpoints (JSON in, JSON out, localhost only by default):
+    GET  /health     worker count and cache statistics
+    POST /simulate   {"input": "<path>", "params": {"TES_cap": 200000, ...}}
+
+Workers are started up front and keep the preprocessed wind/compressor arrays
+of their inputs resident (pipeline.preprocessed_buffer), so a request only pays
+for allocate_energy_storage + calculate_revenue. Responses are cached by the
+hash of the request (input file, its modification time and the parameters,
+with floats rounded to --precision significant digits so that near-duplicate
+queries share an entry) and evicted least-recently-used.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib import request as urllib_request
+
+import pipeline
+
+
+class ResultCache:
+    """Least-recently-used cache of simulation responses."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'max_entries': self.max_entries,
+                'hits': self.hits, 'misses': self.misses}
+
+
+def _round_values(value, precision):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(f"{value:.{precision}g}")
+    if isinstance(value, dict):
+        return {k: _round_values(v, precision) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_round_values(v, precision) for v in value]
+    return value
+
+
+def config_key(input_path, overrides, precision=6):
+    """Hash of a request: input file identity plus the rounded, alias-expanded parameters."""
+    path = os.path.abspath(input_path)
+    payload = {
+        'input': path,
+        'mtime': os.path.getmtime(path),
+        'params': _round_values(pipeline.expand_overrides(overrides), precision),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Worker process side
+# ---------------------------------------------------------------------------
+
+def _init_worker(preload):
+    with pipeline.model_output():
+        for path in preload:
+            pipeline.preprocessed_buffer(path)
+
+
+def _ping():
+    return os.getpid()
+
+
+def simulate(input_path, overrides):
+    """Dispatch + revenue on the resident preprocessed buffer; returns the summary dict."""
+    batch, fixed = pipeline.split_overrides(overrides)
+    with pipeline.model_output():
+        inputs = pipeline.preprocessed_buffer(input_path, fixed)
+        summaries, _ = pipeline.run_summaries(inputs, [batch], fixed)
+    return summaries[0]
+
+
+# ---------------------------------------------------------------------------
+# asyncio front end
+# ---------------------------------------------------------------------------
+
+class SimulationService:
+    """
+    asyncio HTTP front end over a warm process pool.
+
+    Parameters:
+        host, port: listening address (port 0 picks a free port)
+        workers (int): number of worker processes
+        preload (list): input files preprocessed by every worker at start-up
+        cache_size (int): maximum number of cached responses
+        precision (int): significant digits kept in float parameters for the cache key
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=2, preload=(), cache_size=256, precision=6):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.preload = [os.path.abspath(p) for p in preload]
+        self.cache = ResultCache(cache_size)
+        self.precision = precision
+        self.pool = None
+        self.server = None
+        self._inflight = {}
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(self.preload,))
+        # Start every worker now so that the first requests find them warm
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _ping) for _ in range(self.workers)))
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Simulation service listening on http://{self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def run_request(self, body):
+        """Answers one /simulate request body (dict); returns the response dict."""
+        input_path = body['input']
+        overrides = body.get('params', {})
+        key = config_key(input_path, overrides, self.precision)
+        start = time.perf_counter()
+
+        summary = self.cache.get(key)
+        cached = summary is not None
+        if not cached:
+            # Identical requests that arrive while one is running share its result
+            future = self._inflight.get(key)
+            if future is None:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self.pool, simulate, input_path, overrides)
+                self._inflight[key] = future
+                try:
+                    summary = await future
+                    self.cache.put(key, summary)
+                finally:
+                    del self._inflight[key]
+            else:
+                summary = await future
+
+        return {'key': key, 'cached': cached, 'seconds': time.perf_counter() - start, 'summary': summary}
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            if len(request_line) < 2:
+                status, payload = 400, {'error': "malformed request"}
+            elif request_line[:2] == ['GET', '/health']:
+                status, payload = 200, {'status': 'ok', 'workers': self.workers, 'cache': self.cache.stats()}
+            elif request_line[:2] == ['POST', '/simulate']:
+                try:
+                    status, payload = 200, await self.run_request(json.loads(body or b'{}'))
+                except (ValueError, KeyError, FileNotFoundError) as e:
+                    status, payload = 400, {'error': f"{type(e).__name__}: {e}"}
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+            else:
+                status, payload = 404, {'error': f"no route for {' '.join(request_line[:2])}"}
+        except (asyncio.IncompleteReadError, ValueError) as e:
+            status, payload = 400, {'error': f"{type(e).__name__}: {e}"}
+
+        data = json.dumps(payload).encode()
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+        writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + data)
+        await writer.drain()
+        writer.close()
+
+
+def post(url, payload, timeout=300):
+    """Small client helper: POSTs a JSON payload and returns the decoded JSON response."""
+    req = urllib_request.Request(url, data=json.dumps(payload).encode(),
+                                 headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib_request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Wind-CAES simulation service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--preload', nargs='*', default=[], help="input files to keep resident in every worker")
+    parser.add_argument('--cache-size', type=int, default=256)
+    parser.add_argument('--precision', type=int, default=6,
+                        help="significant digits of float parameters in the cache key")
+    args = parser.parse_args(argv)
+
+    service = SimulationService(args.host, args.port, args.workers, args.preload,
+                                args.cache_size, args.precision)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+StreamingRainflow against a plain list-based ASTM E1049 rainflow count of
+the same quantized signals.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cycle_counting import StreamingRainflow
+
+
+def reference_cycles(levels):
+    """(range, count) of every cycle of an integer signal, E1049 three-point rule."""
+    reversals = [levels[0]]
+    for x in levels[1:]:
+        if x == reversals[-1]:
+            continue
+        if len(reversals) >= 2 and (x - reversals[-1]) * (reversals[-1] - reversals[-2]) > 0:
+            reversals[-1] = x
+        else:
+            reversals.append(x)
+    cycles = []
+    stack = []
+    for point in reversals:
+        stack.append(point)
+        while len(stack) >= 3:
+            x = abs(stack[-1] - stack[-2])
+            y = abs(stack[-2] - stack[-3])
+            if x < y:
+                break
+            if len(stack) == 3:
+                cycles.append((y, 0.5))
+                stack.pop(0)
+            else:
+                cycles.append((y, 1.0))
+                del stack[-3:-1]
+    cycles += [(abs(b - a), 0.5) for a, b in zip(stack, stack[1:])]
+    return cycles
+
+
+def streaming(signals, n_levels, n_bins=4, block=256):
+    counter = StreamingRainflow(len(signals), n_levels, n_levels, n_bins, block)
+    for values in np.transpose(signals):
+        counter.update(values)
+    counter.residual()
+    return counter
+
+
+def check(signals, n_levels, n_bins=4, block=256):
+    counter = streaming(signals, n_levels, n_bins, block)
+    for k, signal in enumerate(signals):
+        cycles = reference_cycles(list(signal))
+        histogram = np.zeros(n_bins)
+        for r, count in cycles:
+            histogram[min(int(r / n_levels * n_bins), n_bins - 1)] += count
+        np.testing.assert_allclose(counter.histogram[k], histogram)
+        assert counter.cycles[k] == sum(count for _, count in cycles)
+        np.testing.assert_allclose(counter.damage_sum[k], sum(r / n_levels * count for r, count in cycles))
+        assert counter.max_range[k] == max((r / n_levels for r, _ in cycles), default=0.0)
+
+
+def test_last_point_is_checked():
+    # reversals 4, 0, 5, 4, 7: the closing 7 completes the 5-4 cycle
+    signal = [4, 2, 2, 0, 4, 5, 4, 7, 7]
+    assert sorted(reference_cycles(signal)) == [(1, 1.0), (4, 0.5), (7, 0.5)]
+    check([signal], 8, n_bins=8)
+
+
+def test_random_signals():
+    rng = np.random.RandomState(11)
+    walks = np.clip(20 + np.cumsum(rng.randint(-3, 4, (6, 700)), axis=1), 0, 40)
+    check(walks, 40)
+    check(walks, 40, block=7)
+    check(rng.randint(0, 10, (5, 300)), 10, n_bins=10, block=16)
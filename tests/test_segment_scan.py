@@ -0,0 +1,59 @@
+"""
+Checks of the segmented multi-year scan against the serial run: the
+reported revenue error bound holds for a single (unconverged) fix-up pass,
+and the converged scan reproduces the serial totals.
+"""
+
+import os
+import sys
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline
+import segment_scan
+
+FIXED = {'CAES_loss': 0.0, 'TES_loss': 0.0}
+POINTS = [
+    {'TES_cap': 2000000, 'turbine_capacity': 2000, 'price_threshold': 0.07},
+    {'TES_cap': 300000, 'turbine_capacity': 15000, 'price_threshold': 0.07},
+]
+
+
+def series(hours=24 * 91, seed=3):
+    """Three months of wind, temperature and price (three monthly segments)."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(hours)
+    wind = np.clip(7 + 5 * np.sin(2 * np.pi * t / 97) + rng.normal(0, 2, hours), 0, None)
+    temp = 10 + 4 * np.sin(2 * np.pi * t / 24)
+    price = (0.07 + 0.03 * np.sin(2 * np.pi * (t - 6) / 24) + 0.02 * np.sin(2 * np.pi * t / 168)
+             + rng.normal(0, 0.015, hours))
+    return pd.DataFrame({'windspeed': wind, 'temp': temp, 'price': price})
+
+
+def scan_and_serial(passes):
+    with contextlib.redirect_stdout(io.StringIO()):
+        with pipeline.load_buffer(series(), FIXED) as inputs:
+            scan = segment_scan.segment_scan(inputs, POINTS, FIXED, '2023-01-01T00', 'month', passes=passes)
+            serial, _ = pipeline.run_totals(inputs, POINTS, FIXED)
+    return scan, serial['Total_Revenue']
+
+
+def test_error_within_bound():
+    scan, serial = scan_and_serial(passes=1)
+    error = np.abs(scan['totals']['Total_Revenue'] - serial)
+    assert not scan['converged']
+    assert error.max() > 1.0
+    assert np.all(error <= scan['revenue_error_bound'])
+
+
+def test_converged_scan_matches_serial():
+    scan, serial = scan_and_serial(passes=10)
+    assert scan['converged']
+    error = np.abs(scan['totals']['Total_Revenue'] - serial)
+    assert np.all(error <= scan['revenue_error_bound'])
+    np.testing.assert_allclose(scan['totals']['Total_Revenue'], serial, rtol=1e-12)
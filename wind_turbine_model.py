@@ -5,79 +5,89 @@ def read_wind_data(file_path):
  
     return pd.read_excel(file_path)
 
-def calculate_power_output(df):
+# Columns written by wind_power_stage
+OUTPUT_COLUMNS = ('Power_Output_1', 'Power_Output_2', 'Power_Output_3', 'Total_Power_Output')
 
+# Installed capacity of the wind farm [kW]: 3 x 2 MW, 3 x 1.75 MW, 6 x 0.66 MW
+TOTAL_CAP_WIND_TURBINE = 3*2000+3*1750+6*660
 
-    df['Power_Output_1'] = (
-        -0.7985 * (df['windspeed'] ** 4) +
-        20.23 * (df['windspeed'] ** 3) -
-        157.12 * (df['windspeed'] ** 2) +
-        589.05 * df['windspeed'] -
+def power_curves(windspeed):
+    """Raw power curve polynomials [kW] of the three turbine types (Series or arrays)."""
+    power_1 = (
+        -0.7985 * (windspeed ** 4) +
+        20.23 * (windspeed ** 3) -
+        157.12 * (windspeed ** 2) +
+        589.05 * windspeed -
         837.65
     )
-    df['Power_Output_2'] = (
-        -0.14452 * (df['windspeed'] ** 4) +
-        2.9804 * (df['windspeed'] ** 3) -
-        2.534 * (df['windspeed'] ** 2) -
-        32.955 * df['windspeed'] +
+    power_2 = (
+        -0.14452 * (windspeed ** 4) +
+        2.9804 * (windspeed ** 3) -
+        2.534 * (windspeed ** 2) -
+        32.955 * windspeed +
         77.9625
     )
-    df['Power_Output_3'] = (
-        -0.0665 * (df['windspeed'] ** 4) +
-        0.9589 * (df['windspeed'] ** 3) +
-        6.2757 * (df['windspeed'] ** 2) -
-        58.071 * df['windspeed'] +
+    power_3 = (
+        -0.0665 * (windspeed ** 4) +
+        0.9589 * (windspeed ** 3) +
+        6.2757 * (windspeed ** 2) -
+        58.071 * windspeed +
         96.127
     )
+    return power_1, power_2, power_3
+
+def turbine_limits(windspeed, power, rated_kW, cut_in, rated_from):
+    """Clips a power curve to [0, rated] and applies the rated band, shutdown (> 25 m/s) and cut-in."""
+    power = np.where(power < 0, 0, power)
+    power = np.where(power > rated_kW, rated_kW, power)
+    power = np.where((windspeed >= rated_from) & (windspeed <= 25.1), rated_kW, power)
+    power = np.where(windspeed > 25, 0, power)
+    power = np.where(windspeed < cut_in, 0, power)
+    return power
+
+def limited_power(windspeed, power_1, power_2, power_3):
+    """Operating limits of the three turbine types and the farm total (3 x 2MW, 3 x 1.75MW, 6 x 0.66MW)."""
+    power_1 = turbine_limits(windspeed, power_1, 2000, 3.5, 12.5)
+    power_2 = turbine_limits(windspeed, power_2, 1750, 3.5, 15)
+    power_3 = turbine_limits(windspeed, power_3, 660, 4, 17)
+    total_power = power_1 * 3 + power_2 * 3 + power_3 * 6
+    return power_1, power_2, power_3, total_power
+
+def calculate_power_output(df):
+
+    df['Power_Output_1'], df['Power_Output_2'], df['Power_Output_3'] = power_curves(df['windspeed'])
     return df
 
 def apply_conditions(df):
 
-    # Turbine 1 conditions (2MW)
-    mask1_cut_in = df['windspeed'] < 3.5
-    mask1_shutdown = df['windspeed'] > 25
-    mask1_rated = (df['windspeed'] >= 12.5) & (df['windspeed'] <= 25.1)
-    df.loc[df['Power_Output_1'] < 0, 'Power_Output_1'] = 0
-    df.loc[df['Power_Output_1'] > 2000, 'Power_Output_1'] = 2000
-    df.loc[mask1_rated, 'Power_Output_1'] = 2000
-    df.loc[mask1_shutdown, 'Power_Output_1'] = 0
-    df.loc[mask1_cut_in, 'Power_Output_1'] = 0
-
-    # Turbine 2 conditions (1.75MW)
-    mask2_cut_in = df['windspeed'] < 3.5
-    mask2_shutdown = df['windspeed'] > 25
-    mask2_rated = (df['windspeed'] >= 15) & (df['windspeed'] <= 25.1)
-    df.loc[df['Power_Output_2'] < 0, 'Power_Output_2'] = 0
-    df.loc[df['Power_Output_2'] > 1750, 'Power_Output_2'] = 1750
-    df.loc[mask2_rated, 'Power_Output_2'] = 1750
-    df.loc[mask2_shutdown, 'Power_Output_2'] = 0
-    df.loc[mask2_cut_in, 'Power_Output_2'] = 0
-
-    # Turbine 3 conditions (0.66MW)
-    mask3_cut_in = df['windspeed'] < 4
-    mask3_shutdown = df['windspeed'] > 25
-    mask3_rated = (df['windspeed'] >= 17) & (df['windspeed'] <= 25.1)
-    df.loc[df['Power_Output_3'] < 0, 'Power_Output_3'] = 0
-    df.loc[df['Power_Output_3'] > 660, 'Power_Output_3'] = 660
-    df.loc[mask3_rated, 'Power_Output_3'] = 660
-    df.loc[mask3_shutdown, 'Power_Output_3'] = 0
-    df.loc[mask3_cut_in, 'Power_Output_3'] = 0
-
-    # Calculate total power output using the given turbine counts:
-    total_power = (df['Power_Output_1'] * 3 +
-                   df['Power_Output_2'] * 3 +
-                   df['Power_Output_3'] * 6)
-    df['Total_Power_Output'] = total_power
+    # Turbine conditions (2MW, 1.75MW, 0.66MW) and total power output using the given turbine counts
+    limited = limited_power(df['windspeed'].to_numpy(),
+                            df['Power_Output_1'].to_numpy(),
+                            df['Power_Output_2'].to_numpy(),
+                            df['Power_Output_3'].to_numpy())
+    for col, values in zip(OUTPUT_COLUMNS, limited):
+        df[col] = values
 
     # Count rows in DataFrame and print
     num_rows = len(df)
     print(f"Number of Hours Operation: {num_rows}")
 
-    total_cap_wind_turbine = 3*2000+3*1750+6*660
     cumulative_total_power = df['Total_Power_Output'].sum()
-    wind_turbine_cap_fac = cumulative_total_power / (total_cap_wind_turbine * num_rows) * 100
+    wind_turbine_cap_fac = cumulative_total_power / (TOTAL_CAP_WIND_TURBINE * num_rows) * 100
 
     print(f"Capacity Factor of Wind Farm: {wind_turbine_cap_fac:.2f}%")
      
 
     return df
+
+def wind_power_stage(buf):
+    """
+    Array version of calculate_power_output + apply_conditions.
+
+    Reads 'windspeed' from a StageBuffer (or any mapping of arrays) and writes
+    the OUTPUT_COLUMNS views in place.
+    """
+    windspeed = buf['windspeed']
+    for col, values in zip(OUTPUT_COLUMNS, limited_power(windspeed, *power_curves(windspeed))):
+        buf[col][...] = values
+    return buf